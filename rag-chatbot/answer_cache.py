@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Answer Cache
+Cache câu trả lời của LLM theo fingerprint (câu hỏi đã chuẩn hoá + nội dung context đưa vào prompt)
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+from catalog_cache import CatalogCache
+
+
+def normalize_question(normalized: str) -> str:
+    """Bỏ dấu câu ở cuối để 'có những cửa hàng nào?' và 'có những cửa hàng nào' dùng chung entry"""
+    return " ".join(normalized.strip(" ?!.…").split())
+
+
+def answer_fingerprint(question: str, context_sections: Mapping[str, str]) -> str:
+    """Hash của câu hỏi và toàn bộ context trong prompt. Catalog được làm mới mà context thay đổi
+    thì fingerprint đổi theo, nên câu trả lời cũ không còn được dùng (rồi bị loại theo TTL / LRU)."""
+    payload = json.dumps([question, sorted(context_sections.items())], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """LRU + TTL (dùng lại CatalogCache) và thống kê hit rate / thời gian Gemini tiết kiệm được"""
+
+    def __init__(self, max_entries: int = 2000, max_bytes: int = 16 * 1024 * 1024, ttl_seconds: float = 600):
+        self._cache = CatalogCache(max_entries=max_entries, max_bytes=max_bytes, default_ttl=ttl_seconds, retention_seconds=0)
+        self._lock = threading.Lock()
+        self.metrics = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "saved_ms": 0.0}
+
+    @staticmethod
+    def _key(fingerprint: str) -> str:
+        return f"answer|{fingerprint}"
+
+    def get(self, fingerprint: str) -> Optional[str]:
+        cached = self._cache.get(self._key(fingerprint))
+        with self._lock:
+            self.metrics["lookups"] += 1
+            if cached is None:
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["hits"] += 1
+            self.metrics["saved_ms"] += cached[1]
+        return cached[0]
+
+    def set(self, fingerprint: str, answer: str, generate_ms: float):
+        if not answer:
+            return
+        # Lưu dạng list để approx_size (JSON) ước lượng đúng dung lượng
+        self._cache.set(self._key(fingerprint), [answer, round(generate_ms, 1)])
+        with self._lock:
+            self.metrics["stores"] += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+        metrics["hit_rate"] = round(metrics["hits"] / metrics["lookups"], 4) if metrics["lookups"] else None
+        metrics["saved_ms"] = round(metrics["saved_ms"], 1)
+        cache_stats = self._cache.stats()
+        metrics.update({k: cache_stats[k] for k in ["entries", "bytes", "evictions"]})
+        return metrics
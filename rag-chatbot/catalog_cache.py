@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Catalog Cache
+Bộ nhớ đệm LRU cho dữ liệu catalog: giới hạn số entry, dung lượng ước lượng và TTL theo namespace
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+
+class CacheEntry(NamedTuple):
+    data: Any
+    age: float
+    ttl: float
+    validators: Optional[Dict[str, str]] = None
+
+
+def approx_size(data: Any) -> int:
+    """Ước lượng dung lượng (bytes) của payload theo độ dài JSON"""
+    try:
+        return len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(repr(data))
+
+
+class CatalogCache:
+    """LRU cache có TTL theo namespace (phần trước dấu '|' của key).
+
+    Entry hết TTL vẫn được giữ thêm `retention_seconds` để phục vụ stale-while-revalidate
+    và fallback khi backend lỗi; sau đó bị loại bỏ khi đọc tới.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        max_bytes: int = 64 * 1024 * 1024,
+        default_ttl: float = 60,
+        namespace_ttls: Optional[Dict[str, float]] = None,
+        retention_seconds: float = 3600,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.namespace_ttls = dict(namespace_ttls or {})
+        self.retention_seconds = retention_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        # Tăng mỗi lần dữ liệu thay đổi, dùng để biết khi nào cần ghi snapshot
+        self.version = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "sets": 0, "rejected": 0}
+        self._evictions = {"lru": 0, "size": 0, "expired": 0}
+
+    @staticmethod
+    def namespace(key: str) -> str:
+        return key.split("|", 1)[0]
+
+    def ttl_for(self, key: str) -> float:
+        return self.namespace_ttls.get(self.namespace(key), self.default_ttl)
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """Trả về entry kèm tuổi và TTL (kể cả khi đã hết TTL), None nếu không có"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            ts, data, size, validators = item
+            age = time.time() - ts
+            ttl = self.ttl_for(key)
+            if age > ttl + self.retention_seconds:
+                self._remove(key)
+                self._evictions["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits" if age <= ttl else "stale_hits"] += 1
+            return CacheEntry(data, age, ttl, validators)
+
+    def get(self, key: str) -> Any:
+        """Trả về dữ liệu còn trong TTL, None nếu miss hoặc đã hết hạn"""
+        entry = self.get_entry(key)
+        if entry is None or entry.age > entry.ttl:
+            return None
+        return entry.data
+
+    def peek(self, key: str) -> Any:
+        """Đọc dữ liệu (kể cả đã hết TTL) mà không cập nhật LRU hay thống kê"""
+        with self._lock:
+            item = self._entries.get(key)
+            return item[1] if item is not None else None
+
+    def validators(self, key: str) -> Optional[Dict[str, str]]:
+        """ETag / Last-Modified đã lưu cùng entry (dùng cho conditional GET)"""
+        with self._lock:
+            item = self._entries.get(key)
+            return item[3] if item is not None else None
+
+    def touch(self, key: str) -> Any:
+        """Làm mới thời điểm lưu của entry (khi backend trả 304), trả về dữ liệu hoặc None"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            _, data, size, validators = item
+            self._entries[key] = (time.time(), data, size, validators)
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key: str, data: Any, validators: Optional[Dict[str, str]] = None, age: float = 0.0, size: Optional[int] = None):
+        """Lưu entry. size (bytes) đã biết trước (vd. độ dài body HTTP) thì không phải ước lượng lại bằng approx_size"""
+        if size is None:
+            size = approx_size(data)
+        with self._lock:
+            if size > self.max_bytes:
+                # Giữ nguyên entry cũ (nếu có) để vẫn phục vụ stale / fallback khi backend lỗi
+                self._stats["rejected"] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() - age, data, size, validators or None)
+            self._bytes += size
+            self._stats["sets"] += 1
+            self.version += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions["lru"] += 1
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._evictions["size"] += 1
+
+    def export(self) -> List[tuple]:
+        """Danh sách (key, data, validators, age, size) của các entry còn giữ, theo thứ tự LRU"""
+        now = time.time()
+        with self._lock:
+            return [
+                (key, data, validators, now - ts, size)
+                for key, (ts, data, size, validators) in self._entries.items()
+                if now - ts <= self.ttl_for(key) + self.retention_seconds
+            ]
+
+    def pop(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        size = self._entries.pop(key)[2]
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "evictions": dict(self._evictions),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
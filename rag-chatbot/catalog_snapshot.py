@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Catalog Snapshot
+Lưu / nạp snapshot catalog (products, shops, flash sales) ra file để khởi động lại với cache ấm
+"""
+
+import logging
+import marshal
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SCCS"
+# 2: mỗi entry có thêm dung lượng (bytes) để nạp lại không phải ước lượng
+FORMAT_VERSION = 2
+# magic, format version, python major/minor (định dạng marshal phụ thuộc phiên bản Python)
+_HEADER = struct.Struct("<4sHBB")
+
+
+def save_snapshot(path: str, entries: List[tuple]) -> int:
+    """Ghi snapshot (ghi file tạm rồi os.replace để không bao giờ để lại file dở dang).
+    File tạm riêng cho mỗi lần ghi nên nhiều worker uvicorn ghi cùng lúc không ghi đè lên nhau.
+
+    entries: danh sách (key, data, validators, age, size). Trả về số bytes đã ghi.
+    """
+    payload = marshal.dumps({"saved_at": time.time(), "entries": entries})
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, sys.version_info[0], sys.version_info[1])
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(header) + len(payload)
+
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """Nạp snapshot qua mmap; None nếu không có file, sai định dạng hoặc khác phiên bản Python"""
+    if not path or not os.path.exists(path) or os.path.getsize(path) <= _HEADER.size:
+        return None
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            magic, version, major, minor = _HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or version != FORMAT_VERSION or (major, minor) != sys.version_info[:2]:
+                logger.warning(f"Ignoring catalog snapshot {path}: format={version} python={major}.{minor}")
+                return None
+            view = memoryview(mm)[_HEADER.size:]
+            try:
+                snapshot = marshal.loads(view)
+            finally:
+                view.release()
+    except (OSError, ValueError, EOFError, TypeError, struct.error) as e:
+        logger.error(f"Error loading catalog snapshot {path}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or not isinstance(snapshot.get("entries"), list):
+        return None
+    return snapshot
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Chat Pipeline
+Xử lý tin nhắn theo chuỗi stage có tên (thứ tự cấu hình được), đo thời gian từng stage
+và dừng sớm khi một stage đã có câu trả lời (ngoài phạm vi, cache)
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from latency import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+# Từ chối rẻ (scope guard) chạy trước mọi lần gọi backend
+DEFAULT_STAGE_ORDER = ("normalize", "scope_guard", "intent", "retrieval", "prompt", "cache", "generate", "persist")
+
+
+class ChatState:
+    """Trạng thái của một tin nhắn đi qua pipeline; mỗi stage đọc / ghi các trường của nó"""
+
+    __slots__ = (
+        "message", "user_id", "session_id", "deadline", "priority", "query", "context", "extra_context",
+        "prompt", "packed", "question", "fingerprint", "scope", "answer", "answered_by", "generate_ms", "timings",
+    )
+
+    def __init__(self, message: str, user_id: Optional[str] = None, session_id: Optional[str] = None,
+                 deadline: Optional[float] = None, priority: str = "anonymous"):
+        self.message = message
+        self.user_id = user_id
+        self.session_id = session_id
+        self.deadline = deadline
+        # Lớp ưu tiên khi chờ Gemini (llm_limiter.PRIORITY_CLASSES)
+        self.priority = priority
+        self.query = None
+        self.context: Optional[Dict[str, Any]] = None
+        self.extra_context = ""
+        self.prompt = ""
+        self.packed = None
+        self.question = ""
+        self.fingerprint: Optional[str] = None
+        self.scope: Optional[str] = None
+        self.answer: Optional[str] = None
+        # Stage đã trả lời và dừng pipeline sớm (None nếu câu trả lời do Gemini sinh)
+        self.answered_by: Optional[str] = None
+        self.generate_ms = 0.0
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def done(self) -> bool:
+        return self.answered_by is not None
+
+    def respond(self, answer: str, stage: str):
+        """Trả lời ngay, các stage còn lại không chạy"""
+        self.answer = answer
+        self.answered_by = stage
+
+
+class PipelineStage(NamedTuple):
+    name: str
+    run: Callable[[ChatState], Awaitable[None]]
+    # Các stage phải chạy trước stage này
+    requires: Tuple[str, ...] = ()
+    # Vẫn chạy khi một stage trước đã trả lời (vd. lưu lịch sử hội thoại)
+    always: bool = False
+
+
+def parse_stage_order(value: Optional[str]) -> Tuple[str, ...]:
+    """'normalize,scope_guard,...' -> tuple; rỗng thì dùng DEFAULT_STAGE_ORDER"""
+    names = tuple(name.strip() for name in (value or "").split(",") if name.strip())
+    return names or DEFAULT_STAGE_ORDER
+
+
+class ChatPipeline:
+    """Chạy các stage theo `order`. Stage không có trong order bị bỏ qua; order sai
+    (stage không tồn tại, trùng, thiếu stage bắt buộc / phụ thuộc) thì ghi log và dùng thứ tự mặc định."""
+
+    def __init__(self, stages: Sequence[PipelineStage], order: Sequence[str] = DEFAULT_STAGE_ORDER,
+                 required: Sequence[str] = ("generate",), latency: Optional[LatencyRecorder] = None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.latency = latency or LatencyRecorder()
+        self.short_circuits: Dict[str, int] = {}
+        error = self._validate(order, required)
+        if error:
+            logger.error(f"Invalid chat pipeline order {list(order)}: {error}. Using default {list(DEFAULT_STAGE_ORDER)}")
+            order = DEFAULT_STAGE_ORDER
+        self.order: Tuple[str, ...] = tuple(order)
+
+    def _validate(self, order: Sequence[str], required: Sequence[str]) -> Optional[str]:
+        unknown = [name for name in order if name not in self.stages]
+        if unknown:
+            return f"unknown stages {unknown}"
+        if len(set(order)) != len(order):
+            return "duplicate stages"
+        missing = [name for name in required if name not in order]
+        if missing:
+            return f"missing required stages {missing}"
+        for position, name in enumerate(order):
+            for dependency in self.stages[name].requires:
+                if dependency not in order[:position]:
+                    return f"'{name}' must run after '{dependency}'"
+        return None
+
+    async def run(self, state: ChatState, stop_before: Optional[str] = None) -> ChatState:
+        """Chạy lần lượt các stage (dừng trước stop_before nếu có); sau khi state.done chỉ còn
+        các stage always chạy"""
+        answered = False
+        for name in self.order:
+            if name == stop_before:
+                break
+            if answered and not self.stages[name].always:
+                continue
+            started = time.perf_counter()
+            try:
+                await self.stages[name].run(state)
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                state.timings[name] = round(elapsed_ms, 1)
+                self.latency.record(name, elapsed_ms)
+            if state.done and not answered:
+                answered = True
+                self.short_circuits[name] = self.short_circuits.get(name, 0) + 1
+        return state
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "order": list(self.order),
+            "short_circuits": dict(self.short_circuits),
+            "latency": self.latency.summary(),
+        }
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Circuit Breaker
+Ngắt mạch theo từng endpoint backend: mở sau nhiều lỗi / request chậm liên tiếp, thử lại (half-open) sau reset_timeout
+"""
+
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Circuit đang mở: request bị từ chối ngay, không gọi backend"""
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        slow_call_threshold: Optional[float] = None,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_started_at: Optional[float] = None
+        self._consecutive_failures = 0
+        self._last_state_change = time.time()
+        self._stats = {"successes": 0, "failures": 0, "slow_calls": 0, "rejected": 0}
+        self._transitions: Dict[str, int] = {}
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        """True nếu được gọi backend. Ở half-open chỉ cho một request thăm dò tại một thời điểm."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            now = time.monotonic()
+            # Probe bị huỷ giữa chừng không ghi nhận kết quả: cho phép probe mới sau reset_timeout
+            if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout:
+                self._probe_started_at = now
+                return True
+        self._stats["rejected"] += 1
+        return False
+
+    def record_success(self, elapsed: float = 0.0):
+        """Ghi nhận request thành công; request chậm hơn slow_call_threshold tính như lỗi"""
+        if self.slow_call_threshold is not None and elapsed > self.slow_call_threshold:
+            self._stats["slow_calls"] += 1
+            logger.warning(f"Circuit '{self.name}': slow call {elapsed:.2f}s > {self.slow_call_threshold:.2f}s")
+            self._on_failure()
+            return
+        self._stats["successes"] += 1
+        self._consecutive_failures = 0
+        self._probe_started_at = None
+        if self._state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self._stats["failures"] += 1
+        self._on_failure()
+
+    def _on_failure(self):
+        self._consecutive_failures += 1
+        self._probe_started_at = None
+        if self._state == self.HALF_OPEN or (
+            self._state == self.CLOSED and self._consecutive_failures >= self.failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+    def _transition(self, new_state: str):
+        if new_state == self._state:
+            return
+        key = f"{self._state}->{new_state}"
+        self._transitions[key] = self._transitions.get(key, 0) + 1
+        logger.warning(f"Circuit '{self.name}': {self._state} -> {new_state} (consecutive_failures={self._consecutive_failures})")
+        self._state = new_state
+        self._last_state_change = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._consecutive_failures,
+            "last_state_change": self._last_state_change,
+            "transitions": dict(self._transitions),
+            **self._stats,
+        }
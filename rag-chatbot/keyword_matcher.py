@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Keyword Matcher
+Automaton Aho-Corasick dựng một lần từ nhiều bộ từ khoá: một lần duyệt tin nhắn trả về mọi nhãn khớp
+"""
+
+import unicodedata
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+
+def normalize_keyword_text(text: str) -> str:
+    """NFC + chữ thường, để từ khoá và tin nhắn so khớp theo cùng một dạng"""
+    return unicodedata.normalize("NFC", text or "").lower()
+
+
+class KeywordMatcher:
+    """Khớp chuỗi con (giống `keyword in message.lower()`) cho mọi từ khoá của mọi nhãn cùng lúc.
+
+    vocabularies: nhãn -> danh sách từ khoá. Một từ khoá có thể thuộc nhiều nhãn.
+    Thêm từ khoá chỉ làm automaton lớn hơn, không thêm lần duyệt nào."""
+
+    def __init__(self, vocabularies: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self.labels = list(vocabularies)
+        pending: List[Set[Tuple[str, str]]] = [set()]
+        for label, keywords in vocabularies.items():
+            for keyword in keywords:
+                keyword = normalize_keyword_text(keyword)
+                if not keyword:
+                    continue
+                state = 0
+                for ch in keyword:
+                    nxt = self._goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(self._goto)
+                        self._goto[state][ch] = nxt
+                        self._goto.append({})
+                        self._fail.append(0)
+                        pending.append(set())
+                    state = nxt
+                pending[state].add((label, keyword))
+
+        # BFS từ các con của gốc (fail = 0): fail link của mỗi trạng thái và gộp output theo chuỗi fail link
+        queue = deque(self._goto[0].values())
+        order = []
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                queue.append(nxt)
+        for state in order:
+            pending[state] |= pending[self._fail[state]]
+        self._output: List[FrozenSet[Tuple[str, str]]] = [frozenset(items) for items in pending]
+
+    def scan(self, text: str) -> Dict[str, Set[str]]:
+        """nhãn -> các từ khoá của nhãn đó xuất hiện trong text (một lần duyệt)"""
+        matches: Dict[str, Set[str]] = {}
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for ch in normalize_keyword_text(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for label, keyword in output[state]:
+                matches.setdefault(label, set()).add(keyword)
+        return matches
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Latency
+Ghi nhận độ trễ theo từng stage (cửa sổ trượt) và tóm tắt p50 / p95 cho /metrics
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+
+import numpy as np
+
+
+class LatencyRecorder:
+    """Giữ tối đa `window` mẫu gần nhất (ms) cho mỗi stage"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+            samples.append(elapsed_ms)
+            self._counts[stage] += 1
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {stage: (list(samples), self._counts[stage]) for stage, samples in self._samples.items()}
+        result = {}
+        for stage, (samples, count) in snapshot.items():
+            values = np.array(samples)
+            result[stage] = {
+                "count": count,
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p95_ms": round(float(np.percentile(values, 95)), 3),
+                "max_ms": round(float(values.max()), 3),
+            }
+        return result
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+LLM Limiter
+Kiểm soát việc gọi Gemini: hàng đợi theo độ ưu tiên (user đăng nhập trước anonymous), giới hạn hàng đợi theo lớp,
+số lời gọi đồng thời tự điều chỉnh (giảm khi bị 429 / hết quota, tăng dần lại khi ổn định) và bỏ sớm
+các request không còn kịp hoàn thành trước deadline
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from latency import LatencyRecorder
+
+# Thứ tự = độ ưu tiên khi giao slot
+PRIORITY_CLASSES = ("authenticated", "anonymous")
+
+
+def priority_class(authenticated: bool) -> str:
+    """authenticated do caller xác định từ đường xác thực (bearer token hợp lệ, Backend C# có secret),
+    không từ user_id client tự gửi"""
+    return "authenticated" if authenticated else "anonymous"
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """429 / hết quota từ Gemini (google.api_core ResourceExhausted, TooManyRequests) mà không cần import SDK"""
+    if getattr(error, "code", None) == 429 or type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+
+class LLMOverloadedError(Exception):
+    """Request bị từ chối thay vì treo: hàng đợi đầy, không kịp deadline hoặc Gemini đang giới hạn tốc độ"""
+
+    def __init__(self, message: str, reason: str = "queue_full", retry_after: float = 1.0):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("future", "priority", "deadline", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, priority: str, deadline: float):
+        self.future = future
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """Semaphore có hàng đợi ưu tiên và giới hạn đồng thời thích ứng (AIMD).
+
+    - limit nằm trong [min_concurrency, max_concurrency]: nhân backoff_factor khi gặp 429 (tối đa một lần mỗi
+      backoff_cooldown giây, vì các lời gọi đang chạy thường cùng bị 429), cộng 1/limit sau mỗi lời gọi thành công.
+    - Slot trống được giao cho người chờ đầu hàng của lớp ưu tiên cao nhất; người chờ không còn đủ thời gian
+      (deadline - thời gian sinh ước lượng) bị loại ngay thay vì chiếm slot rồi quá hạn.
+    Chỉ dùng trong event loop (không cần lock). Deadline tính theo time.monotonic()."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        queue_limits: Optional[Dict[str, int]] = None,
+        backoff_factor: float = 0.5,
+        backoff_cooldown: float = 5.0,
+        default_deadline: float = 30.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.queue_limits = {cls: 64 for cls in PRIORITY_CLASSES}
+        self.queue_limits.update(queue_limits or {})
+        self.backoff_factor = backoff_factor
+        self.backoff_cooldown = backoff_cooldown
+        self.default_deadline = default_deadline
+        self._limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._last_backoff = -math.inf
+        # Thời gian sinh trung bình (EWMA, giây) của các lời gọi thành công, dùng để ước lượng có kịp deadline không
+        self._expected_seconds: Optional[float] = None
+        self.latency = LatencyRecorder()
+        self.metrics = {"rate_limited": 0, "backoffs": 0, "errors": 0}
+        self.class_metrics = {
+            cls: {"admitted": 0, "queued": 0, "rejected": 0, "dropped_deadline": 0} for cls in PRIORITY_CLASSES
+        }
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _ahead_of(self, priority: str) -> int:
+        """Số người chờ sẽ được phục vụ trước một request mới thuộc lớp priority"""
+        ahead = 0
+        for cls in PRIORITY_CLASSES:
+            ahead += len(self._queues[cls])
+            if cls == priority:
+                break
+        return ahead
+
+    def _retry_after(self) -> float:
+        expected = self._expected_seconds or 1.0
+        wait = expected * (self.queue_depth + 1) / max(self.limit, 1)
+        cooldown = self._last_backoff + self.backoff_cooldown - time.monotonic()
+        return round(max(1.0, wait, cooldown), 1)
+
+    def _reject(self, priority: str, reason: str, message: str) -> LLMOverloadedError:
+        key = "dropped_deadline" if reason == "deadline" else "rejected"
+        self.class_metrics[priority][key] += 1
+        return LLMOverloadedError(message, reason=reason, retry_after=self._retry_after())
+
+    async def acquire(self, priority: str = "authenticated", deadline: Optional[float] = None):
+        """Chờ tới khi có slot; LLMOverloadedError nếu hàng đợi của lớp đầy hoặc không kịp deadline"""
+        if priority not in self._queues:
+            priority = PRIORITY_CLASSES[-1]
+        now = time.monotonic()
+        deadline = deadline if deadline is not None else now + self.default_deadline
+        expected = self._expected_seconds or 0.0
+        if self._in_flight < self.limit and not self.queue_depth:
+            self._admitted(priority, now)
+            return
+        queue = self._queues[priority]
+        if len(queue) >= self.queue_limits[priority]:
+            raise self._reject(priority, "queue_full", f"LLM queue for {priority} users is full ({len(queue)} waiting)")
+        # Ước lượng: những người chờ phía trước được phục vụ theo lượt, mỗi lượt `limit` lời gọi
+        estimated_wait = expected * (self._ahead_of(priority) + 1) / max(self.limit, 1)
+        if now + estimated_wait + expected > deadline:
+            raise self._reject(priority, "deadline", f"LLM request cannot finish before its deadline (estimated wait {estimated_wait:.1f}s)")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), priority, deadline)
+        queue.append(waiter)
+        self.class_metrics[priority]["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(deadline - now - expected, 0))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                # Slot đã được giao đúng lúc hết hạn: trả lại cho người kế tiếp
+                self.release()
+            else:
+                waiter.future.cancel()
+                try:
+                    queue.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(priority, "deadline", "Waited until the deadline for an LLM slot") from None
+            raise
+        self._admitted(priority, waiter.enqueued_at, granted=True)
+
+    def _admitted(self, priority: str, since: float, granted: bool = False):
+        if not granted:
+            self._in_flight += 1
+        self.class_metrics[priority]["admitted"] += 1
+        self.latency.record(f"wait_{priority}", (time.monotonic() - since) * 1000)
+
+    def release(self, duration: Optional[float] = None, error: Optional[BaseException] = None):
+        """Trả slot. duration (giây) / error của lời gọi vừa xong dùng để điều chỉnh limit"""
+        self._in_flight -= 1
+        if error is not None:
+            if is_rate_limit_error(error):
+                self._on_rate_limited()
+            else:
+                self.metrics["errors"] += 1
+        elif duration is not None:
+            self._expected_seconds = duration if self._expected_seconds is None else 0.8 * self._expected_seconds + 0.2 * duration
+            self._limit = min(float(self.max_concurrency), self._limit + 1 / max(self._limit, 1))
+        self._dispatch()
+
+    def _on_rate_limited(self):
+        self.metrics["rate_limited"] += 1
+        now = time.monotonic()
+        if now - self._last_backoff >= self.backoff_cooldown:
+            self._limit = max(float(self.min_concurrency), self._limit * self.backoff_factor)
+            self._last_backoff = now
+            self.metrics["backoffs"] += 1
+
+    def _dispatch(self):
+        """Giao slot trống theo thứ tự ưu tiên; loại người chờ không còn kịp deadline"""
+        expected = self._expected_seconds or 0.0
+        now = time.monotonic()
+        for cls in PRIORITY_CLASSES:
+            queue = self._queues[cls]
+            while queue and self._in_flight < self.limit:
+                waiter = queue.popleft()
+                if waiter.future.done():
+                    continue
+                if now + expected > waiter.deadline:
+                    waiter.future.set_exception(self._reject(cls, "deadline", "LLM request dropped: it can no longer finish before its deadline"))
+                    continue
+                self._in_flight += 1
+                waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "authenticated", deadline: Optional[float] = None) -> AsyncIterator[None]:
+        await self.acquire(priority, deadline)
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        self.release(duration=time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "limit": self.limit,
+            "max_concurrency": self.max_concurrency,
+            "min_concurrency": self.min_concurrency,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "expected_generate_ms": round(self._expected_seconds * 1000, 1) if self._expected_seconds is not None else None,
+            "classes": {
+                cls: {**self.class_metrics[cls], "queue_depth": len(self._queues[cls]), "queue_limit": self.queue_limits[cls]}
+                for cls in PRIORITY_CLASSES
+            },
+            "latency": self.latency.summary(),
+        }
@@ -1,17 +1,34 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
-import requests
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Awaitable, Tuple
+import httpx
+import asyncio
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
+import hmac
 import json
 import logging
+import math
 import time
 import uuid
-import difflib
-import re
-from policies import search_policy, get_purchase_policy, get_sales_policy, get_general_terms
+from concurrent.futures import ThreadPoolExecutor
+from policies import search_policy, search_policy_sections, find_policy_sections, format_policy_sections, get_purchase_policy, get_sales_policy, get_general_terms, POLICY_SECTION_KEYWORDS
+from catalog_cache import CatalogCache, CacheEntry, approx_size
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from catalog_snapshot import save_snapshot, load_snapshot
+from product_store import ProductStoreCache
+from search_index import reciprocal_rank_fusion
+from latency import LatencyRecorder
+from shop_index import ShopNameIndex
+from query_parser import QueryParser, ParsedQuery
+from answer_cache import AnswerCache, answer_fingerprint, normalize_question
+from semantic_cache import SemanticAnswerCache
+from chat_pipeline import ChatPipeline, ChatState, PipelineStage, parse_stage_order
+from llm_limiter import AdmissionController, LLMOverloadedError, is_rate_limit_error, priority_class
+from prompt_budget import PromptSection, PackedPrompt, PromptSizeStats, estimate_tokens, pack_sections, truncate_text
+from vector_index import VectorProductIndex, create_embedding_function
 
 # Load environment variables
 load_dotenv()
@@ -31,6 +48,92 @@ app = FastAPI(
 gemini_api_key = os.getenv("GOOGLE_API_KEY")
 backend_api_url = os.getenv("BACKEND_API_URL")
 
+# Backend HTTP client (connection pool dùng chung cho mọi request)
+BACKEND_TIMEOUT_SECONDS = float(os.getenv("BACKEND_TIMEOUT_SECONDS", "10"))
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "100"))
+BACKEND_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("BACKEND_MAX_KEEPALIVE_CONNECTIONS", "20"))
+BACKEND_KEEPALIVE_EXPIRY = float(os.getenv("BACKEND_KEEPALIVE_EXPIRY", "30"))
+
+# Thời gian chờ tối đa cho mỗi nguồn context (sản phẩm, cửa hàng, flash sale) trong một tin nhắn
+CONTEXT_FETCH_TIMEOUT_SECONDS = float(os.getenv("CONTEXT_FETCH_TIMEOUT_SECONDS", "4"))
+
+# Số sản phẩm liên quan nhất đưa vào prompt (toàn catalog / sản phẩm của một shop)
+PRODUCT_CONTEXT_TOP_K = int(os.getenv("PRODUCT_CONTEXT_TOP_K", "5"))
+SHOP_PRODUCT_CONTEXT_TOP_K = int(os.getenv("SHOP_PRODUCT_CONTEXT_TOP_K", "10"))
+
+# Cách chọn sản phẩm cho prompt: "keyword" (BM25), "vector" (ANN trên chroma_db, embedding cục bộ)
+# hoặc "hybrid" (cả hai, gộp bằng reciprocal-rank fusion). Để trống: hybrid nếu có model embedding
+# (VECTOR_EMBEDDING_MODEL), ngược lại keyword vì hashing embedding chỉ là thêm một ranking theo từ
+PRODUCT_RETRIEVAL_MODE = os.getenv("PRODUCT_RETRIEVAL_MODE", "").lower()
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "chroma_db"))
+# Thư mục model sentence-transformers có sẵn trên máy; để trống thì dùng hashing embedding
+VECTOR_EMBEDDING_MODEL = os.getenv("VECTOR_EMBEDDING_MODEL", "")
+# Mỗi index trả về top_k * hệ số này ứng viên trước khi gộp
+RETRIEVAL_CANDIDATE_MULTIPLIER = int(os.getenv("RETRIEVAL_CANDIDATE_MULTIPLIER", "4"))
+# Ngân sách prompt gửi Gemini (token ước lượng theo số ký tự) và độ dài tối đa mỗi mô tả
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "2500"))
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", "3"))
+PROMPT_DESCRIPTION_MAX_CHARS = int(os.getenv("PROMPT_DESCRIPTION_MAX_CHARS", "300"))
+# Tỉ lệ tối đa của ngân sách prompt dành cho tin nhắn người dùng; tin nhắn dài hơn bị cắt bớt
+PROMPT_QUESTION_MAX_SHARE = float(os.getenv("PROMPT_QUESTION_MAX_SHARE", "0.25"))
+
+# Cache câu trả lời Gemini theo (câu hỏi chuẩn hoá + context trong prompt)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Cache ngữ nghĩa: câu hỏi gần nghĩa (cosine >= ngưỡng) với câu đã trả lời, cùng intent + context.
+# Chỉ có hiệu lực khi có model embedding cục bộ (VECTOR_EMBEDDING_MODEL)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+# Thứ tự các stage xử lý tin nhắn; bỏ tên stage để tắt (vd. bỏ "cache"), generate là bắt buộc
+CHAT_PIPELINE_STAGES = parse_stage_order(os.getenv("CHAT_PIPELINE_STAGES"))
+# Số lời gọi Gemini đồng thời: tối đa / tối thiểu khi tự giảm vì 429 / hết quota
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_MIN_CONCURRENCY = int(os.getenv("GEMINI_MIN_CONCURRENCY", "1"))
+# Số request được chờ Gemini theo lớp: user đã xác thực (được phục vụ trước) / anonymous
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "64"))
+GEMINI_MAX_QUEUE_ANONYMOUS = int(os.getenv("GEMINI_MAX_QUEUE_ANONYMOUS", "16"))
+# Gặp 429: nhân số lời gọi đồng thời với hệ số này, tối đa một lần mỗi cooldown
+GEMINI_BACKOFF_FACTOR = float(os.getenv("GEMINI_BACKOFF_FACTOR", "0.5"))
+GEMINI_BACKOFF_COOLDOWN_SECONDS = float(os.getenv("GEMINI_BACKOFF_COOLDOWN_SECONDS", "5"))
+# Thời gian tối đa cho một tin nhắn kể từ khi nhận request; request không còn kịp bị trả 503 sớm
+GEMINI_REQUEST_DEADLINE_SECONDS = float(os.getenv("GEMINI_REQUEST_DEADLINE_SECONDS", "30"))
+# Secret dùng chung với Backend C# (header X-Internal-Token); chỉ request có secret đúng mới được ưu tiên theo user_id trong body
+BACKEND_SHARED_SECRET = os.getenv("BACKEND_SHARED_SECRET", "")
+
+# Chính sách đưa vào prompt: "sections" (chỉ các mục liên quan, giới hạn kích thước) hoặc "full" (cả văn bản)
+POLICY_CONTEXT_MODE = os.getenv("POLICY_CONTEXT_MODE", "sections").lower()
+POLICY_CONTEXT_MAX_SECTIONS = int(os.getenv("POLICY_CONTEXT_MAX_SECTIONS", "3"))
+POLICY_CONTEXT_MAX_CHARS = int(os.getenv("POLICY_CONTEXT_MAX_CHARS", "1200"))
+
+# Điểm Dice (trigram) tối thiểu để coi một shop là được nhắc tới trong tin nhắn
+SHOP_MATCH_MIN_SCORE = float(os.getenv("SHOP_MATCH_MIN_SCORE", "0.6"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Bỏ kết quả vector có cosine similarity không vượt ngưỡng (láng giềng "gần nhất" nhưng không liên quan)
+VECTOR_MIN_SIMILARITY = float(os.getenv("VECTOR_MIN_SIMILARITY", "0.05"))
+
+# Catalog cache: phục vụ dữ liệu cũ trong lúc làm mới ở background (stale-while-revalidate)
+CATALOG_STALE_WHILE_REVALIDATE = os.getenv("CATALOG_STALE_WHILE_REVALIDATE", "true").lower() == "true"
+CATALOG_MAX_STALE_SECONDS = float(os.getenv("CATALOG_MAX_STALE_SECONDS", "300"))
+SHOP_FULL_CRAWL = os.getenv("SHOP_FULL_CRAWL", "true").lower() == "true"
+SHOP_CRAWL_PAGE_SIZE = int(os.getenv("SHOP_CRAWL_PAGE_SIZE", "50"))
+SHOP_CRAWL_CONCURRENCY = int(os.getenv("SHOP_CRAWL_CONCURRENCY", "4"))
+SHOP_CRAWL_MAX_PAGES = int(os.getenv("SHOP_CRAWL_MAX_PAGES", "200"))
+SHOP_NOT_FOUND_TTL_SECONDS = float(os.getenv("SHOP_NOT_FOUND_TTL_SECONDS", "30"))
+BACKEND_BREAKER_FAILURE_THRESHOLD = int(os.getenv("BACKEND_BREAKER_FAILURE_THRESHOLD", "5"))
+BACKEND_BREAKER_RESET_SECONDS = float(os.getenv("BACKEND_BREAKER_RESET_SECONDS", "30"))
+BACKEND_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BACKEND_BREAKER_SLOW_CALL_SECONDS", "3"))
+CATALOG_CACHE_MAX_ENTRIES = int(os.getenv("CATALOG_CACHE_MAX_ENTRIES", "1000"))
+CATALOG_CACHE_MAX_BYTES = int(os.getenv("CATALOG_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CATALOG_CACHE_RETENTION_SECONDS = float(os.getenv("CATALOG_CACHE_RETENTION_SECONDS", "3600"))
+# Snapshot catalog trên đĩa để khởi động lại với cache ấm (để trống để tắt)
+CATALOG_SNAPSHOT_PATH = os.getenv(
+    "CATALOG_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog_snapshot.bin")
+)
+CATALOG_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_INTERVAL_SECONDS", "60"))
+
 if not gemini_api_key:
     raise ValueError("GOOGLE_API_KEY not found in environment variables")
 
@@ -91,6 +194,10 @@ class UserSession:
                     return "user_authenticated_456"
         import uuid
         return f"anonymous_{str(uuid.uuid4())[:8]}"
+
+    def is_authenticated(self, auth_header: str) -> bool:
+        """Authorization header chứa token hợp lệ"""
+        return not self.extract_user_id_from_auth(auth_header).startswith("anonymous_")
     
     def save_message(self, session_id: str, message: str, response: str):
         """Lưu tin nhắn vào session"""
@@ -102,208 +209,651 @@ class UserSession:
             })
 
 class APIService:
-    """Service to handle external API calls"""
-    _cache: Dict[str, tuple] = {}
+    """Cache catalog dùng chung và các hàm parse payload backend cho AsyncAPIService"""
     _CACHE_TTL_SECONDS = 60
+    # TTL theo namespace (tên method): flash sale thay đổi nhanh hơn danh sách shop
+    _CACHE_TTLS: Dict[str, float] = {
+        "get_products": 60,
+        "get_shops": 300,
+        "get_products_by_shop": 120,
+        "get_current_flash_sales": 15,
+        "get_shop_by_id": 300,
+        # Negative cache cho shop id không tồn tại (404)
+        "get_shop_by_id_missing": SHOP_NOT_FOUND_TTL_SECONDS,
+    }
+    _CACHE_MAX_STALE_SECONDS = CATALOG_MAX_STALE_SECONDS
+    _cache = CatalogCache(
+        max_entries=CATALOG_CACHE_MAX_ENTRIES,
+        max_bytes=CATALOG_CACHE_MAX_BYTES,
+        default_ttl=_CACHE_TTL_SECONDS,
+        namespace_ttls=_CACHE_TTLS,
+        retention_seconds=max(CATALOG_CACHE_RETENTION_SECONDS, CATALOG_MAX_STALE_SECONDS),
+    )
 
     @classmethod
     def _cache_key(cls, name: str, **params) -> str:
         return name + "|" + "&".join(f"{k}={v}" for k, v in sorted(params.items()))
 
+    @classmethod
+    def _cache_entry(cls, key: str) -> Optional[CacheEntry]:
+        """Trả về entry kể cả khi đã hết TTL, để phục vụ stale / fallback khi backend lỗi"""
+        return cls._cache.get_entry(key)
+
     @classmethod
     def _cache_get(cls, key: str):
-        item = cls._cache.get(key)
-        if not item:
-            return None
-        ts, data = item
-        if time.time() - ts > cls._CACHE_TTL_SECONDS:
-            cls._cache.pop(key, None)
-            return None
-        return data
+        return cls._cache.get(key)
 
     @classmethod
-    def _cache_set(cls, key: str, data):
-        cls._cache[key] = (time.time(), data)
+    def _cache_set(cls, key: str, data, validators: Optional[Dict[str, str]] = None, size: Optional[int] = None):
+        cls._cache.set(key, data, validators=validators, size=size)
+
+    @staticmethod
+    def _parse_flash_sales(data: Any) -> List[Dict]:
+        """Extract flash sale list from backend payload"""
+        flash_list: List[Dict] = []
+        if isinstance(data, dict):
+            if isinstance(data.get("data"), list):
+                flash_list = data["data"]
+            elif isinstance(data.get("items"), list):
+                flash_list = data["items"]
+            elif isinstance(data.get("result"), list):
+                flash_list = data["result"]
+            elif isinstance(data.get("Results"), list):
+                flash_list = data["Results"]
+            else:
+                if {"productName", "flashSalePrice"}.issubset(set(data.keys())):
+                    flash_list = [data]
+        elif isinstance(data, list):
+            flash_list = data
+        return flash_list
+
+    @staticmethod
+    def _parse_products(data: Any) -> Optional[List[Dict]]:
+        """Extract product list from backend payload (None if format is unexpected)"""
+        if isinstance(data, dict) and "data" in data:
+            return data["data"]
+        elif isinstance(data, list):
+            return data
+        logger.warning(f"Unexpected products response format: {type(data)}")
+        return None
+
+    @staticmethod
+    def _parse_shops(data: Any) -> List[Dict]:
+        """Extract approved + active shops from backend payload"""
+        return APIService._filter_active_shops(APIService._extract_shop_items(data))
+
+    @staticmethod
+    def _extract_shop_items(data: Any) -> List[Dict]:
+        """Extract raw shop list (chưa lọc) from backend payload"""
+        shops_list: List[Dict] = []
+        if isinstance(data, dict):
+            if "items" in data and isinstance(data["items"], list):
+                shops_list = data["items"]
+            elif "data" in data and isinstance(data["data"], list):
+                shops_list = data["data"]
+            else:
+                for key in ["result", "Results", "shops", "Shops"]:
+                    if key in data and isinstance(data[key], list):
+                        shops_list = data[key]
+                        break
+                if not shops_list:
+                    logger.warning(f"Unexpected shops response keys: {list(data.keys())}")
+                    shops_list = []
+        elif isinstance(data, list):
+            shops_list = data
+        else:
+            logger.warning(f"Unexpected shops response type: {type(data)}")
+            shops_list = []
+        return shops_list
+
+    @staticmethod
+    def _filter_active_shops(shops_list: List[Dict]) -> List[Dict]:
+        """Chỉ giữ các shop đã được duyệt và đang hoạt động"""
+        before_count = len(shops_list)
+        filtered = [s for s in shops_list if (str(s.get('approvalStatus', '')).lower() == 'approved'.lower()) and (s.get('status', True) in [True, 'true', 1])]
+        logger.info(f"Shops filtering: before={before_count} after={len(filtered)} approved+active")
+        return filtered
+
+    @staticmethod
+    def _parse_total_pages(data: Any, page_size: int) -> Optional[int]:
+        """Đọc tổng số trang từ metadata phân trang (None nếu backend không trả về)"""
+        if not isinstance(data, dict):
+            return None
+        for key in ["totalPages", "TotalPages", "pageCount", "PageCount"]:
+            if isinstance(data.get(key), int):
+                return data[key]
+        for key in ["totalCount", "TotalCount", "totalItems", "TotalItems", "total"]:
+            if isinstance(data.get(key), int) and page_size > 0:
+                return max(1, -(-data[key] // page_size))
+        return None
+
+    @staticmethod
+    def _parse_shop(data: Any) -> Dict:
+        """Extract a single shop from backend payload"""
+        if isinstance(data, dict) and "data" in data:
+            return data["data"]
+        elif isinstance(data, dict):
+            return data
+        logger.warning(f"Unexpected shop response format: {type(data)}")
+        return {}
 
     @staticmethod
-    def get_current_flash_sales() -> List[Dict]:
+    def _parse_shop_products(data: Any) -> Optional[List[Dict]]:
+        """Extract products of a shop from backend payload (None if format is unexpected)"""
+        if isinstance(data, dict):
+            for key in ["items", "data", "products", "Products", "result", "Results"]:
+                if key in data and isinstance(data[key], list):
+                    return data[key]
+            if all(k in data for k in ["productName", "name", "id"]):
+                return [data]
+            logger.warning(f"Unexpected shop products keys: {list(data.keys())}")
+            return None
+        elif isinstance(data, list):
+            return data
+        logger.warning(f"Unexpected shop products response type: {type(data)}")
+        return None
+
+# Lỗi backend được xử lý bằng fallback về dữ liệu cache
+BACKEND_ERRORS = (httpx.HTTPError, CircuitOpenError)
+
+class NotModified(Exception):
+    """Backend trả 304: dữ liệu trong cache vẫn còn đúng"""
+
+class AsyncAPIService:
+    """Backend client: dùng chung một httpx.AsyncClient (keep-alive, connection pool)
+    để các request /chat đồng thời không chặn event loop khi gọi backend."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        timeout: float = BACKEND_TIMEOUT_SECONDS,
+        max_connections: int = BACKEND_MAX_CONNECTIONS,
+        max_keepalive_connections: int = BACKEND_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = BACKEND_KEEPALIVE_EXPIRY,
+        stale_while_revalidate: bool = CATALOG_STALE_WHILE_REVALIDATE,
+        shop_full_crawl: bool = SHOP_FULL_CRAWL,
+        shop_crawl_page_size: int = SHOP_CRAWL_PAGE_SIZE,
+        shop_crawl_concurrency: int = SHOP_CRAWL_CONCURRENCY,
+        shop_crawl_max_pages: int = SHOP_CRAWL_MAX_PAGES,
+        breaker_failure_threshold: int = BACKEND_BREAKER_FAILURE_THRESHOLD,
+        breaker_reset_seconds: float = BACKEND_BREAKER_RESET_SECONDS,
+        breaker_slow_call_seconds: float = BACKEND_BREAKER_SLOW_CALL_SECONDS,
+        snapshot_path: Optional[str] = CATALOG_SNAPSHOT_PATH,
+        snapshot_interval: float = CATALOG_SNAPSHOT_INTERVAL_SECONDS,
+    ):
+        self.base_url = base_url or backend_api_url or ""
+        self.timeout = httpx.Timeout(timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stale_while_revalidate = stale_while_revalidate
+        self.shop_full_crawl = shop_full_crawl
+        self.shop_crawl_page_size = shop_crawl_page_size
+        self.shop_crawl_concurrency = max(1, shop_crawl_concurrency)
+        self.shop_crawl_max_pages = shop_crawl_max_pages
+        self.breaker_failure_threshold = breaker_failure_threshold
+        self.breaker_reset_seconds = breaker_reset_seconds
+        self.breaker_slow_call_seconds = breaker_slow_call_seconds
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_version = -1
+        self._background_tasks: List[asyncio.Task] = []
+        self.snapshot_metrics: Dict[str, Any] = {
+            "restored_entries": 0,
+            "restore_ms": None,
+            "last_saved_at": None,
+            "last_saved_bytes": 0,
+        }
+        # Single-flight: cache_key -> task đang fetch, các request trùng key chờ chung kết quả
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # ETag / Last-Modified của response 200 gần nhất, chờ lưu cùng payload vào cache
+        self._pending_validators: Dict[str, Dict[str, str]] = {}
+        # Độ dài body của response vừa fetch theo cache key, dùng làm dung lượng entry trong cache
+        self._pending_sizes: Dict[str, int] = {}
+        self.metrics: Dict[str, int] = {
+            "backend_fetches": 0,
+            "coalesced_fetches": 0,
+            "stale_served": 0,
+            "stale_on_error": 0,
+            "background_refresh_failures": 0,
+            "not_modified": 0,
+            "bytes_downloaded": 0,
+            "shop_lookups_from_list": 0,
+            "shop_not_found_cache_hits": 0,
+        }
+        # Index id -> shop dựng lại mỗi khi danh sách shop trong cache được làm mới
+        self._shop_index: Dict[str, Dict] = {}
+        # Danh sách shop (trong cache) mà _shop_index được dựng từ đó; giữ tham chiếu để so sánh bằng `is`
+        self._shop_index_source: Optional[List[Dict]] = None
+
+    async def startup(self):
+        """Mở connection pool, nạp snapshot catalog và làm mới nó ở background (gọi từ FastAPI startup hook)"""
+        self._open_client()
+        if self.snapshot_path:
+            if self.restore_snapshot():
+                self._background_tasks.append(asyncio.ensure_future(self._warm_up()))
+            self._background_tasks.append(asyncio.ensure_future(self._snapshot_loop()))
+
+    async def shutdown(self):
+        """Ghi snapshot và đóng connection pool (gọi từ FastAPI shutdown hook)"""
+        for task in self._background_tasks + list(self._inflight.values()):
+            task.cancel()
+        self._background_tasks = []
+        if self.snapshot_path:
+            await self.save_snapshot()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("Backend client closed")
+
+    def _open_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+            logger.info(
+                f"Backend client started: base_url={self.base_url} "
+                f"max_connections={self.limits.max_connections} "
+                f"max_keepalive={self.limits.max_keepalive_connections}"
+            )
+        return self._client
+
+    def restore_snapshot(self) -> int:
+        """Nạp snapshot vào cache. Entry được đánh dấu vừa hết TTL để được phục vụ ngay
+        và làm mới ở background; entry cũ hơn thời gian giữ của cache bị bỏ qua."""
+        started = time.perf_counter()
+        snapshot = load_snapshot(self.snapshot_path)
+        if not snapshot:
+            return 0
+        snapshot_age = max(0.0, time.time() - snapshot.get("saved_at", 0))
+        restored = 0
+        for key, data, validators, age, size in snapshot["entries"]:
+            ttl = APIService._cache.ttl_for(key)
+            if snapshot_age + age > ttl + APIService._cache.retention_seconds:
+                continue
+            APIService._cache.set(key, data, validators=validators, age=ttl + 1, size=size)
+            restored += 1
+        self._snapshot_version = APIService._cache.version
+        restore_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.snapshot_metrics.update({"restored_entries": restored, "restore_ms": restore_ms})
+        logger.info(f"Catalog snapshot restored: entries={restored} age={snapshot_age:.0f}s in {restore_ms}ms")
+        return restored
+
+    async def save_snapshot(self) -> bool:
+        """Ghi snapshot nếu cache đã thay đổi kể từ lần ghi trước"""
+        version = APIService._cache.version
+        if version == self._snapshot_version:
+            return False
+        entries = APIService._cache.export()
+        try:
+            size = await asyncio.to_thread(save_snapshot, self.snapshot_path, entries)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error saving catalog snapshot {self.snapshot_path}: {e}")
+            return False
+        self._snapshot_version = version
+        self.snapshot_metrics.update({"last_saved_at": time.time(), "last_saved_bytes": size})
+        logger.info(f"Catalog snapshot saved: entries={len(entries)} bytes={size}")
+        return True
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            await self.save_snapshot()
+
+    async def _warm_up(self):
+        """Đọc các catalog chính để kích hoạt làm mới dữ liệu nạp từ snapshot"""
+        await asyncio.gather(self.get_products(), self.get_shops(), self.get_current_flash_sales())
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                endpoint,
+                failure_threshold=self.breaker_failure_threshold,
+                reset_timeout=self.breaker_reset_seconds,
+                slow_call_threshold=self.breaker_slow_call_seconds,
+            )
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    async def _get_json(self, endpoint: str, path: str, label: str, params: Optional[Dict[str, Any]] = None, cache_key: Optional[str] = None) -> Any:
+        """GET path trên backend, trả về JSON đã decode (None nếu body không phải JSON).
+
+        Mỗi endpoint có circuit breaker riêng: khi mở, raise CircuitOpenError ngay để caller
+        dùng dữ liệu cache thay vì chờ timeout.
+        Khi có cache_key, gửi conditional GET với ETag / Last-Modified đã lưu cùng entry;
+        backend trả 304 thì raise NotModified để giữ nguyên payload đã cache."""
+        breaker = self._breaker(endpoint)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit '{endpoint}' is open")
+        client = self._open_client()
+        headers: Dict[str, str] = {}
+        validators = APIService._cache.validators(cache_key) if cache_key else None
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        logger.info(f"Fetching {label}: GET {path} params={params}" + (" (conditional)" if headers else ""))
+        started = time.perf_counter()
+        try:
+            response = await client.get(path, params=params, headers=headers)
+        except httpx.TransportError:
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success(time.perf_counter() - started)
+        logger.info(f"{label} response status={response.status_code}")
+        if response.status_code == 304 and headers:
+            self.metrics["not_modified"] += 1
+            raise NotModified()
+        response.raise_for_status()
+        self.metrics["bytes_downloaded"] += len(response.content)
+        if cache_key:
+            new_validators = {
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+            }
+            self._pending_validators[cache_key] = {k: v for k, v in new_validators.items() if v}
+            self._pending_sizes[cache_key] = len(response.content)
+        try:
+            return response.json()
+        except ValueError:
+            logger.error(f"{label} response not JSON: {response.text[:300]}")
+            return None
+
+    async def _get_or_fetch(self, cache_key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Trả về dữ liệu cache; khi miss chỉ request đầu tiên gọi fetch(), các request
+        đồng thời cùng key chờ chung kết quả. fetch() trả về None nghĩa là không cache.
+
+        Stale-while-revalidate: entry hết TTL (theo namespace) nhưng chưa quá _CACHE_MAX_STALE_SECONDS được trả
+        ngay và làm mới ở background. Nếu backend lỗi, giá trị tốt gần nhất vẫn được dùng."""
+        entry = APIService._cache_entry(cache_key)
+        if entry is not None:
+            if entry.age <= entry.ttl:
+                return entry.data
+            if self.stale_while_revalidate and entry.age <= entry.ttl + APIService._CACHE_MAX_STALE_SECONDS:
+                self.metrics["stale_served"] += 1
+                self._refresh_in_background(cache_key, fetch)
+                return entry.data
+        try:
+            result = await self._single_flight(cache_key, fetch)
+        except BACKEND_ERRORS as e:
+            if entry is None:
+                raise
+            self.metrics["stale_on_error"] += 1
+            logger.warning(f"Backend error for {cache_key}, serving last good value (age={entry.age:.0f}s): {e}")
+            return entry.data
+        if result is None and entry is not None:
+            return entry.data
+        return result
+
+    def _refresh_in_background(self, cache_key: str, fetch: Callable[[], Awaitable[Any]]):
+        if cache_key in self._inflight:
+            return
+        task = self._start_fetch(cache_key, fetch)
+        task.add_done_callback(lambda t: self._on_background_refresh_done(cache_key, t))
+
+    def _on_background_refresh_done(self, cache_key: str, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.metrics["background_refresh_failures"] += 1
+            logger.warning(f"Background refresh failed for {cache_key}: {error}")
+
+    async def _single_flight(self, cache_key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(cache_key)
+        if task is not None:
+            self.metrics["coalesced_fetches"] += 1
+            return await asyncio.shield(task)
+        return await asyncio.shield(self._start_fetch(cache_key, fetch))
+
+    def _start_fetch(self, cache_key: str, fetch: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        async def fetch_and_store():
+            try:
+                try:
+                    result = await fetch()
+                except NotModified:
+                    data = APIService._cache.touch(cache_key)
+                    if data is not None:
+                        return data
+                    # Entry bị loại khỏi cache trong lúc chờ: fetch lại không điều kiện
+                    result = await fetch()
+                if result is not None:
+                    size = self._pending_sizes.get(cache_key)
+                    if size is None:
+                        # Không có độ dài response (crawl nhiều trang shop, shop theo id): ước lượng ngoài event loop
+                        size = await asyncio.to_thread(approx_size, result)
+                    APIService._cache_set(cache_key, result, validators=self._pending_validators.get(cache_key), size=size)
+                return result
+            finally:
+                self._inflight.pop(cache_key, None)
+                self._pending_validators.pop(cache_key, None)
+                self._pending_sizes.pop(cache_key, None)
+
+        self.metrics["backend_fetches"] += 1
+        task = asyncio.ensure_future(fetch_and_store())
+        self._inflight[cache_key] = task
+        return task
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Số liệu của backend client"""
+        return {
+            **self.metrics,
+            "inflight_fetches": len(self._inflight),
+            "circuit_breakers": {name: b.stats() for name, b in self._breakers.items()},
+            "snapshot": dict(self.snapshot_metrics),
+        }
+
+    async def get_current_flash_sales(self) -> List[Dict]:
         """Fetch current flash sales from backend API"""
         try:
-            url = f"{backend_api_url}/api/flashsales/current"
+            async def fetch():
+                data = await self._get_json("flash_sales", "/api/flashsales/current", "Flash sales", cache_key=cache_key)
+                return APIService._parse_flash_sales(data) if data is not None else None
+
             cache_key = APIService._cache_key("get_current_flash_sales")
-            cached = APIService._cache_get(cache_key)
-            if cached is not None:
-                return cached
-            logger.info(f"Fetching current flash sales: GET {url}")
-            response = requests.get(url, timeout=10)
-            logger.info(f"Flash sales response status={response.status_code}")
-            response.raise_for_status()
-            raw_text = response.text
-            try:
-                data = response.json()
-            except ValueError:
-                logger.error(f"Flash sales response not JSON: {raw_text[:300]}")
-                return []
-            flash_list: List[Dict] = []
-            if isinstance(data, dict):
-                if isinstance(data.get("data"), list):
-                    flash_list = data["data"]
-                elif isinstance(data.get("items"), list):
-                    flash_list = data["items"]
-                elif isinstance(data.get("result"), list):
-                    flash_list = data["result"]
-                elif isinstance(data.get("Results"), list):
-                    flash_list = data["Results"]
-                else:
-                    if {"productName", "flashSalePrice"}.issubset(set(data.keys())):
-                        flash_list = [data]
-            elif isinstance(data, list):
-                flash_list = data
-            APIService._cache_set(cache_key, flash_list)
-            return flash_list
-        except requests.RequestException as e:
+            flash_list = await self._get_or_fetch(cache_key, fetch)
+            return flash_list if flash_list is not None else []
+        except BACKEND_ERRORS as e:
             logger.error(f"Error fetching current flash sales: {e}")
             return []
-    
-    @staticmethod
-    def get_products() -> List[Dict]:
+
+    async def get_products(self) -> List[Dict]:
         """Fetch products from backend API"""
         try:
+            async def fetch():
+                data = await self._get_json("products", "/api/products", "Products", cache_key=cache_key)
+                return APIService._parse_products(data) if data is not None else None
+
             cache_key = APIService._cache_key("get_products")
-            cached = APIService._cache_get(cache_key)
-            if cached is not None:
-                return cached
-            response = requests.get(f"{backend_api_url}/api/products", timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            if isinstance(data, dict) and "data" in data:
-                APIService._cache_set(cache_key, data["data"])
-                return data["data"]
-            elif isinstance(data, list):
-                APIService._cache_set(cache_key, data)
-                return data
-            else:
-                logger.warning(f"Unexpected products response format: {type(data)}")
-                return []
-        except requests.RequestException as e:
+            products = await self._get_or_fetch(cache_key, fetch)
+            return products if products is not None else []
+        except BACKEND_ERRORS as e:
             logger.error(f"Error fetching products: {e}")
             return []
-    
-    @staticmethod
-    def get_shops() -> List[Dict]:
-        """Fetch shops from backend API"""
+
+    async def get_shops(self, full_crawl: Optional[bool] = None) -> List[Dict]:
+        """Fetch approved + active shops from backend API (tất cả các trang khi full_crawl)"""
         try:
-            url = f"{backend_api_url}/api/shops"
-            params = {"pageNumber": 1, "pageSize": 10, "ascending": "true"}
-            cache_key = APIService._cache_key("get_shops", **params)
-            cached = APIService._cache_get(cache_key)
-            if cached is not None:
-                return cached
-            logger.info(f"Fetching shops: GET {url} params={params}")
-            response = requests.get(url, params=params, timeout=10)
-            logger.info(f"Shops response status={response.status_code}")
-            response.raise_for_status()
-            raw_text = response.text
-            try:
-                data = response.json()
-            except ValueError:
-                logger.error(f"Shops response is not JSON: {raw_text[:300]}")
-                return []
-            shops_list: List[Dict] = []
-            if isinstance(data, dict):
-                if "items" in data and isinstance(data["items"], list):
-                    shops_list = data["items"]
-                elif "data" in data and isinstance(data["data"], list):
-                    shops_list = data["data"]
-                else:
-                    for key in ["result", "Results", "shops", "Shops"]:
-                        if key in data and isinstance(data[key], list):
-                            shops_list = data[key]
-                            break
-                    if not shops_list:
-                        logger.warning(f"Unexpected shops response keys: {list(data.keys())}")
-                        shops_list = []
-            elif isinstance(data, list):
-                shops_list = data
+            if full_crawl is None:
+                full_crawl = self.shop_full_crawl
+            cache_key = self._shops_cache_key(full_crawl)
+            if full_crawl:
+                fetch = self._crawl_shops
             else:
-                logger.warning(f"Unexpected shops response type: {type(data)}")
-                shops_list = []
-            before_count = len(shops_list)
-            filtered = [s for s in shops_list if (str(s.get('approvalStatus', '')).lower() == 'approved'.lower()) and (s.get('status', True) in [True, 'true', 1])]
-            logger.info(f"Shops filtering: before={before_count} after={len(filtered)} approved+active")
-            APIService._cache_set(cache_key, filtered)
-            return filtered
-        except requests.RequestException as e:
+                params = {"pageNumber": 1, "pageSize": 10, "ascending": "true"}
+
+                async def fetch():
+                    data = await self._get_json("shops", "/api/shops", "Shops", params=params, cache_key=cache_key)
+                    return APIService._parse_shops(data) if data is not None else None
+
+            shops = await self._get_or_fetch(cache_key, fetch)
+            return shops if shops is not None else []
+        except BACKEND_ERRORS as e:
             logger.error(f"Error fetching shops: {e}")
             return []
-    
-    @staticmethod
-    def get_shop_by_id(shop_id: str) -> Dict:
-        """Fetch specific shop by ID"""
+
+    def _shops_cache_key(self, full_crawl: bool) -> str:
+        if full_crawl:
+            return APIService._cache_key("get_shops", crawl="all", pageSize=self.shop_crawl_page_size)
+        return APIService._cache_key("get_shops", pageNumber=1, pageSize=10, ascending="true")
+
+    def _shops_by_id(self) -> Dict[str, Dict]:
+        """Index id -> shop trên danh sách shop đang có trong cache (không gọi backend)"""
+        shops = APIService._cache.peek(self._shops_cache_key(self.shop_full_crawl))
+        if not shops:
+            return {}
+        if shops is not self._shop_index_source:
+            self._shop_index = {str(s.get('id')).lower(): s for s in shops if s.get('id') is not None}
+            self._shop_index_source = shops
+        return self._shop_index
+
+    async def _crawl_shops(self) -> Optional[List[Dict]]:
+        """Crawl toàn bộ danh sách shop: trang 1 cho biết tổng số trang, các trang còn lại
+        được fetch song song (tối đa shop_crawl_concurrency request cùng lúc)."""
+        page_size = self.shop_crawl_page_size
+
+        async def fetch_page(page: int) -> List[Dict]:
+            params = {"pageNumber": page, "pageSize": page_size, "ascending": "true"}
+            data = await self._get_json("shops", "/api/shops", f"Shops page {page}", params=params)
+            return APIService._extract_shop_items(data) if data is not None else []
+
+        first = await self._get_json("shops", "/api/shops", "Shops page 1", params={"pageNumber": 1, "pageSize": page_size, "ascending": "true"})
+        if first is None:
+            return None
+        shops: List[Dict] = list(APIService._extract_shop_items(first))
+        total_pages = APIService._parse_total_pages(first, page_size)
+        if total_pages is None:
+            # Không có metadata phân trang: đọc tuần tự tới khi gặp trang thiếu
+            page, last = 1, shops
+            while len(last) >= page_size and page < self.shop_crawl_max_pages:
+                page += 1
+                last = await fetch_page(page)
+                shops.extend(last)
+            total_pages = page
+        elif total_pages > 1:
+            total_pages = min(total_pages, self.shop_crawl_max_pages)
+            semaphore = asyncio.Semaphore(self.shop_crawl_concurrency)
+
+            async def fetch_page_bounded(page: int) -> List[Dict]:
+                async with semaphore:
+                    return await fetch_page(page)
+
+            for items in await asyncio.gather(*(fetch_page_bounded(p) for p in range(2, total_pages + 1))):
+                shops.extend(items)
+
+        unique: Dict[Any, Dict] = {}
+        for shop in shops:
+            unique.setdefault(shop.get('id') or id(shop), shop)
+        logger.info(f"Shop crawl: pages={total_pages} shops={len(unique)}")
+        return APIService._filter_active_shops(list(unique.values()))
+
+    async def get_shop_by_id(self, shop_id: str) -> Dict:
+        """Fetch specific shop by ID.
+
+        Ưu tiên danh sách shop đang có trong cache, sau đó cache theo id; id không tồn tại (404)
+        được cache âm trong SHOP_NOT_FOUND_TTL_SECONDS."""
         try:
-            response = requests.get(f"{backend_api_url}/api/shops/{shop_id}", timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            if isinstance(data, dict) and "data" in data:
-                return data["data"]
-            elif isinstance(data, dict):
-                return data
-            else:
-                logger.warning(f"Unexpected shop response format: {type(data)}")
+            shop = self._shops_by_id().get(str(shop_id).lower())
+            if shop:
+                self.metrics["shop_lookups_from_list"] += 1
+                return shop
+            missing_key = APIService._cache_key("get_shop_by_id_missing", shop_id=shop_id)
+            if APIService._cache_get(missing_key) is not None:
+                self.metrics["shop_not_found_cache_hits"] += 1
+                return {}
+            cache_key = APIService._cache_key("get_shop_by_id", shop_id=shop_id)
+
+            async def fetch():
+                try:
+                    data = await self._get_json("shop_by_id", f"/api/shops/{shop_id}", "Shop")
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code != 404:
+                        raise
+                    APIService._cache.pop(cache_key)
+                    APIService._cache_set(missing_key, True)
+                    return None
+                return (APIService._parse_shop(data) or None) if data is not None else None
+
+            shop = await self._get_or_fetch(cache_key, fetch)
+            if APIService._cache_get(missing_key) is not None:
+                # 404 khi fetch chặn (entry quá hạn stale): không trả lại dữ liệu cũ của shop đã bị xoá
                 return {}
-        except requests.RequestException as e:
+            return shop or {}
+        except BACKEND_ERRORS as e:
             logger.error(f"Error fetching shop {shop_id}: {e}")
             return {}
 
-    @staticmethod
-    def get_products_by_shop(shop_id: str, active_only: bool = True) -> List[Dict]:
+    async def get_products_by_shop(self, shop_id: str, active_only: bool = True) -> List[Dict]:
         """Fetch products belonging to a specific shop"""
         try:
-            url = f"{backend_api_url}/api/products/shop/{shop_id}"
             params = {"activeOnly": str(active_only).lower()}
             cache_key = APIService._cache_key("get_products_by_shop", shop_id=shop_id, activeOnly=params["activeOnly"])
-            cached = APIService._cache_get(cache_key)
-            if cached is not None:
-                return cached
-            logger.info(f"Fetching products of shop {shop_id}: GET {url} params={params}")
-            response = requests.get(url, params=params, timeout=10)
-            logger.info(f"Shop products response status={response.status_code}")
-            response.raise_for_status()
-            raw_text = response.text
-            try:
-                data = response.json()
-            except ValueError:
-                logger.error(f"Shop products response not JSON: {raw_text[:300]}")
-                return []
-            if isinstance(data, dict):
-                for key in ["items", "data", "products", "Products", "result", "Results"]:
-                    if key in data and isinstance(data[key], list):
-                        APIService._cache_set(cache_key, data[key])
-                        return data[key]
-                if all(k in data for k in ["productName", "name", "id"]):
-                    APIService._cache_set(cache_key, [data])
-                    return [data]
-                logger.warning(f"Unexpected shop products keys: {list(data.keys())}")
-                return []
-            elif isinstance(data, list):
-                APIService._cache_set(cache_key, data)
-                return data
-            else:
-                logger.warning(f"Unexpected shop products response type: {type(data)}")
-                return []
-        except requests.RequestException as e:
+
+            async def fetch():
+                data = await self._get_json("products_by_shop", f"/api/products/shop/{shop_id}", "Shop products", params=params, cache_key=cache_key)
+                return APIService._parse_shop_products(data) if data is not None else None
+
+            products = await self._get_or_fetch(cache_key, fetch)
+            return products if products is not None else []
+        except BACKEND_ERRORS as e:
             logger.error(f"Error fetching products for shop {shop_id}: {e}")
             return []
 
 class PromptTemplateService:
-    """Custom prompt template service (替代 LangChain)"""
+    """Custom prompt template service (替代 LangChain)
 
-    @staticmethod
-    def create_main_prompt(user_message: str, products_info: str, shops_info: str, flash_sales_info: str = "", context: str = "") -> str:
+    Context (sản phẩm, thông tin thêm, flash sale, cửa hàng, ngữ cảnh) được xếp theo thứ tự ưu tiên
+    vào ngân sách max_prompt_tokens; phần không vừa bị cắt bớt hoặc bỏ. Kích thước prompt cuối
+    cùng được ghi vào size_stats."""
+
+    # Thứ tự ưu tiên khi xếp context vào ngân sách token
+    SECTION_PRIORITIES = {"products": 1, "extra": 2, "flash_sales": 3, "shops": 4, "context": 5}
+
+    def __init__(self, max_prompt_tokens: int = PROMPT_MAX_TOKENS, chars_per_token: float = PROMPT_CHARS_PER_TOKEN,
+                 question_max_share: float = PROMPT_QUESTION_MAX_SHARE):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.chars_per_token = chars_per_token
+        self.question_max_share = question_max_share
+        self.size_stats = PromptSizeStats()
+
+    def build_main_prompt(self, user_message: str, products_info: str, shops_info: str, flash_sales_info: str = "", context: str = "", extra_info: str = "") -> Tuple[str, PackedPrompt]:
+        """Create main chatbot prompt trong ngân sách token, trả về (prompt, thông tin xếp context)"""
+        # Phần khung cố định của template cũng tính vào ngân sách
+        budget = self.max_prompt_tokens - estimate_tokens(self._render("", "", "", "", "", "", ""), self.chars_per_token)
+        sections = [
+            PromptSection("instructions", SYSTEM_INSTRUCTIONS, 0, required=True),
+            PromptSection("question", user_message, 0, required=True, max_tokens=max(int(budget * self.question_max_share), 1)),
+            PromptSection("products", products_info, self.SECTION_PRIORITIES["products"]),
+            PromptSection("extra", extra_info, self.SECTION_PRIORITIES["extra"]),
+            PromptSection("flash_sales", flash_sales_info, self.SECTION_PRIORITIES["flash_sales"]),
+            PromptSection("shops", shops_info, self.SECTION_PRIORITIES["shops"]),
+            PromptSection("context", context, self.SECTION_PRIORITIES["context"]),
+        ]
+        packed = pack_sections(sections, budget, self.chars_per_token)
+        s = packed.sections
+        prompt = self._render(s["instructions"], s["products"], s["extra"], s["shops"], s["flash_sales"], s["context"], s["question"])
+        packed = packed._replace(tokens=estimate_tokens(prompt, self.chars_per_token))
+        self.size_stats.record(packed)
+        return prompt, packed
+
+    def create_main_prompt(self, user_message: str, products_info: str, shops_info: str, flash_sales_info: str = "", context: str = "", extra_info: str = "") -> str:
         """Create main chatbot prompt"""
+        return self.build_main_prompt(user_message, products_info, shops_info, flash_sales_info, context, extra_info)[0]
+
+    @staticmethod
+    def _render(instructions: str, products_info: str, extra_info: str, shops_info: str, flash_sales_info: str, context: str, user_message: str) -> str:
+        if extra_info:
+            products_info += "\n\nTHÔNG TIN THÊM:\n" + extra_info
         return f"""
 HƯỚNG DẪN HỆ THỐNG (KHÔNG TIẾT LỘ CHO NGƯỜI DÙNG):
-{SYSTEM_INSTRUCTIONS}
+{instructions}
 
 THÔNG TIN SẢN PHẨM:
 {products_info}
@@ -326,235 +876,370 @@ YÊU CẦU TRẢ LỜI:
 - Ngắn gọn, chính xác, tiếng Việt.
 """
 
-    @staticmethod  
-    def create_product_search_prompt(user_query: str, products: List[Dict]) -> str:
-        """Create product search specific prompt"""
-        products_text = json.dumps(products, ensure_ascii=False, indent=2)
-        return f"""
+    def create_product_search_prompt(self, user_query: str, products: List[Dict]) -> str:
+        """Create product search specific prompt: mỗi sản phẩm một dòng JSON gọn (chỉ các trường cần
+        cho câu trả lời, mô tả đã cắt ngắn), thêm theo thứ tự cho tới khi hết ngân sách token"""
+        header = """
 Dựa trên danh sách sản phẩm sau và yêu cầu của người dùng, hãy tìm và giới thiệu các sản phẩm phù hợp:
 
 DANH SÁCH SẢN PHẨM:
-{products_text}
-
+"""
+        footer = f"""
 YÊU CẦU TÌM KIẾM: {user_query}
 
 Hãy trả lời bằng tiếng Việt, giới thiệu các sản phẩm phù hợp với yêu cầu và cung cấp thông tin chi tiết về giá, mô tả, v.v.
 """
+        budget_chars = int((self.max_prompt_tokens - estimate_tokens(header + footer, self.chars_per_token)) * self.chars_per_token)
+        lines = []
+        used = 0
+        for product in products:
+            compact = {
+                "name": product.get('productName') or product.get('name'),
+                "price": product.get('finalPrice', product.get('basePrice', product.get('price'))),
+                "description": truncate_text(str(product.get('description') or ''), PROMPT_DESCRIPTION_MAX_CHARS),
+            }
+            for key in ["basePrice", "stockQuantity", "status"]:
+                if product.get(key) is not None:
+                    compact[key] = product[key]
+            line = json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+            if used + len(line) + 1 > budget_chars:
+                break
+            lines.append(line)
+            used += len(line) + 1
+        prompt = header + "\n".join(lines) + "\n" + footer
+        self.size_stats.record(PackedPrompt({}, estimate_tokens(prompt, self.chars_per_token), (), ()))
+        return prompt
+
+PRODUCT_KEYWORDS = ["sản phẩm", "mua", "giá", "product", "price", "tìm kiếm", "tìm", "search"]
+SHOP_KEYWORDS = ["cửa hàng", "shop", "store", "bán hàng", "địa chỉ", "bán những gì", "bán gì"]
+FLASH_SALE_KEYWORDS = [
+    "flash sale", "flashsale", "flash-sales", "deal sốc", "giờ vàng", "sale sốc", "sale giờ vàng",
+    "giảm giá nhanh", "chớp nhoáng", "deal hot", "deal hôm nay"
+]
+POLICY_KEYWORDS = [
+    'chính sách', 'policy', 'quy định', 'điều khoản', 'quy tắc',
+    'mua hàng', 'bán hàng', 'đặt hàng', 'thanh toán', 'giao hàng',
+    'vận chuyển', 'đổi trả', 'hoàn tiền', 'mở shop', 'đăng ký shop',
+    'vi phạm', 'xử lý vi phạm', 'trách nhiệm', 'nghĩa vụ'
+]
+OUT_OF_SCOPE_KEYWORDS = [
+    "thời tiết", "weather", "chính trị", "politics", "bóng đá", "football",
+    "crypto", "tiền ảo", "coin", "chứng khoán", "stock", "forex", "tiểu sử",
+    "life story", "tiểu thuyết", "game", "anime", "phim", "movie"
+]
+# Knowledge base ngắn: (từ khoá, đoạn thông tin thêm vào prompt)
+KNOWLEDGE_BASE = [
+    (['thanh toán', 'payment', 'trả tiền'], "Phương thức thanh toán: hỗ trợ ví điện tử, thẻ ngân hàng nội địa và quốc tế, COD tùy khu vực."),
+    (['vận chuyển', 'giao hàng', 'ship'], "Vận chuyển: đối tác giao hàng tiêu chuẩn 2-5 ngày làm việc, có tuỳ chọn nhanh ở một số tỉnh."),
+    (['đổi trả', 'hoàn hàng', 'trả hàng', 'refund'], "Đổi trả: chấp nhận trong 7 ngày nếu sản phẩm lỗi / sai mô tả, cần video & ảnh khi nhận hàng."),
+    (['khuyến mãi', 'mã giảm', 'voucher', 'giảm giá'], "Khuyến mãi: nhập mã tại bước thanh toán; mỗi đơn áp dụng tối đa 1 mã + freeship nếu đủ điều kiện."),
+    (['hỗ trợ', 'support', 'liên hệ', 'care'], "Hỗ trợ: bạn có thể gửi câu hỏi qua mục Trợ giúp hoặc chat trực tiếp trong khung giờ 8h-22h."),
+    (['đơn hàng', 'tình trạng đơn', 'tracking', 'mã đơn'], "Theo dõi đơn: vào mục 'Đơn hàng của tôi' để xem trạng thái cập nhật thời gian thực."),
+    (['flash sale', 'deal sốc', 'giờ vàng', 'sale giờ vàng', 'flashsale'], "Flash Sale: diễn ra trong khung giờ giới hạn, số lượng có hạn, nên thanh toán sớm để giữ mức giá ưu đãi.")
+]
+
+# Mọi bộ từ khoá (cùng từ khoá trạng thái hàng) gộp vào một automaton trong QUERY_PARSER:
+# một lần duyệt tin nhắn cho ra tất cả intent
+QUERY_PARSER = QueryParser({
+    "product": PRODUCT_KEYWORDS,
+    "shop": SHOP_KEYWORDS,
+    "flash_sale": FLASH_SALE_KEYWORDS,
+    "policy": POLICY_KEYWORDS,
+    "policy_section": POLICY_SECTION_KEYWORDS,
+    "out_of_scope": OUT_OF_SCOPE_KEYWORDS,
+    **{f"kb:{i}": keys for i, (keys, _) in enumerate(KNOWLEDGE_BASE)},
+})
+
+OUT_OF_SCOPE_ANSWER = (
+    "Xin lỗi, tôi chỉ hỗ trợ các câu hỏi liên quan đến nền tảng StreamCart như sản phẩm, cửa hàng, giá, đặt hàng và hỗ trợ sử dụng. "
+    "Bạn có thể hỏi: 'Có những cửa hàng nào?', 'Giá sản phẩm A?', 'Cách mua hàng?'"
+)
 
 class ChatbotService:
     """Main chatbot service using Gemini"""
     
-    def __init__(self):
-        self.api_service = APIService()
+    def __init__(self, context_fetch_timeout: float = CONTEXT_FETCH_TIMEOUT_SECONDS, sessions: Optional[UserSession] = None):
+        self.api_service = AsyncAPIService()
+        # Lịch sử hội thoại, được ghi ở stage persist
+        self.sessions = sessions
         self.prompt_service = PromptTemplateService()
+        self.context_fetch_timeout = context_fetch_timeout
+        self.product_stores = ProductStoreCache()
+        self.vector_index = VectorProductIndex(VECTOR_INDEX_PATH, create_embedding_function(VECTOR_EMBEDDING_MODEL))
+        self.retrieval_mode = PRODUCT_RETRIEVAL_MODE or (
+            "hybrid" if getattr(self.vector_index.embedding_function, "semantic", False) else "keyword"
+        )
+        self._vector_synced_products: Optional[List[Dict]] = None
+        self._vector_sync_task: Optional[asyncio.Task] = None
+        self.retrieval_latency = LatencyRecorder()
+        # Gemini chạy trong executor riêng để không chặn event loop; limiter quyết định số lời gọi đồng thời
+        self.llm_limiter = AdmissionController(
+            max_concurrency=GEMINI_MAX_CONCURRENCY,
+            min_concurrency=GEMINI_MIN_CONCURRENCY,
+            queue_limits={"authenticated": GEMINI_MAX_QUEUE, "anonymous": GEMINI_MAX_QUEUE_ANONYMOUS},
+            backoff_factor=GEMINI_BACKOFF_FACTOR,
+            backoff_cooldown=GEMINI_BACKOFF_COOLDOWN_SECONDS,
+            default_deadline=GEMINI_REQUEST_DEADLINE_SECONDS,
+        )
+        self.llm_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+        # Thứ tự stage xử lý tin nhắn (CHAT_PIPELINE_STAGES), thời gian từng stage trong /metrics
+        self.pipeline = ChatPipeline(self._pipeline_stages(), CHAT_PIPELINE_STAGES)
+        # chat_total (/chat), stream_ttfb (tới đoạn câu trả lời đầu tiên) và stream_total (/chat/stream)
+        self.chat_latency = LatencyRecorder()
+        self._shop_index: Optional[ShopNameIndex] = None
+        self.answer_cache: Optional[AnswerCache] = (
+            AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_MAX_BYTES, ANSWER_CACHE_TTL_SECONDS) if ANSWER_CACHE_ENABLED else None
+        )
+        # Dùng chung embedding cục bộ với vector index sản phẩm. Hashing embedding chỉ so từ, không so nghĩa
+        # ('áo màu đen' ~ 'áo màu trắng'), nên cache ngữ nghĩa chỉ bật khi VECTOR_EMBEDDING_MODEL load được
+        self.semantic_cache: Optional[SemanticAnswerCache] = None
+        if SEMANTIC_CACHE_ENABLED:
+            if getattr(self.vector_index.embedding_function, "semantic", False):
+                self.semantic_cache = SemanticAnswerCache(
+                    self.vector_index.embedding_function, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS
+                )
+            else:
+                logger.warning("Semantic answer cache disabled: no local embedding model loaded (VECTOR_EMBEDDING_MODEL)")
     
-    def get_relevant_context(self, user_message: str) -> Dict[str, Any]:
-        """Get relevant products and shops data based on user message"""
-        context: Dict[str, Any] = {
+    def parse_query(self, message: str) -> ParsedQuery:
+        """Phân tích tin nhắn một lần: text chuẩn hoá / bỏ dấu, khoảng giá, trạng thái, intent, tên shop"""
+        return QUERY_PARSER.parse(message)
+
+    async def get_relevant_context(self, user_message: str, query: Optional[ParsedQuery] = None) -> Dict[str, Any]:
+        """Get relevant products and shops data based on user message.
+
+        Các nguồn dữ liệu (sản phẩm, cửa hàng + sản phẩm của shop, flash sale) được lấy song song,
+        mỗi nguồn có timeout riêng; nguồn nào xong kịp thì được đưa vào context."""
+        context = self.empty_context()
+
+        if query is None:
+            query = self.parse_query(user_message)
+        price_filter = query.price_filter
+        status_filter = query.status
+        wants_products = query.has_intent("product")
+        wants_shops = query.has_intent("shop")
+        wants_flash = query.has_intent("flash_sale")
+
+        async def skip():
+            return None
+
+        products, shop_result, flash_sales = await asyncio.gather(
+            self._fetch_with_timeout("products", self.api_service.get_products()) if wants_products else skip(),
+            self._get_shop_context(query) if wants_shops else skip(),
+            self._fetch_with_timeout("flash_sales", self.api_service.get_current_flash_sales()) if wants_flash else skip(),
+        )
+
+        context["degraded"] = (
+            (wants_products and products is None)
+            or (wants_shops and (shop_result is None or (shop_result[1] and shop_result[2] is None)))
+            or (wants_flash and flash_sales is None)
+        )
+
+        if products:
+            self._schedule_vector_sync(products)
+            products = await self.retrieve_products(products, user_message, price_filter, status_filter, PRODUCT_CONTEXT_TOP_K)
+        if products:
+            context["products"] = products
+            context["products_info"] = self.format_products_info(products)
+
+        if shop_result:
+            shops, matched, shop_products = shop_result
+            context["shops"] = shops
+            context["shops_info"] = self.format_shops_info(shops)
+            if matched:
+                context["matched_shop"] = matched
+                if shop_products:
+                    shop_products = await self.retrieve_products(
+                        shop_products, user_message, price_filter, status_filter, SHOP_PRODUCT_CONTEXT_TOP_K
+                    )
+                if shop_products:
+                    limited = shop_products
+                    context["products"] = limited
+                    context["products_info"] = (
+                        "SẢN PHẨM CỦA CỬA HÀNG: "
+                        + (matched.get('shopName') or matched.get('name') or '')
+                        + "\n" + self.format_products_info(limited, SHOP_PRODUCT_CONTEXT_TOP_K)
+                    )
+                elif shop_products is not None:
+                    context["products_info"] = (
+                        "Chưa tìm thấy sản phẩm nào cho cửa hàng "
+                        + (matched.get('shopName') or matched.get('name') or '')
+                    )
+
+        if wants_flash:
+            if flash_sales:
+                context["flash_sales"] = flash_sales
+                context["flash_sales_info"] = self.format_flash_sales_info(flash_sales)
+            elif flash_sales is not None:
+                context["flash_sales_info"] = "Hiện tại chưa có chương trình flash sale đang diễn ra."
+
+        return context
+
+    @staticmethod
+    def empty_context() -> Dict[str, Any]:
+        """Context khi chưa lấy dữ liệu nào (cũng dùng khi stage retrieval bị tắt)"""
+        return {
             "products": [],
             "shops": [],
             "products_info": "Chưa có thông tin sản phẩm.",
             "shops_info": "Chưa có thông tin cửa hàng.",
             "matched_shop": None,
             "flash_sales": [],
-            "flash_sales_info": "Chưa có flash sale nào."
+            "flash_sales_info": "Chưa có flash sale nào.",
+            # True nếu có nguồn được yêu cầu nhưng không lấy được kịp (context không đầy đủ)
+            "degraded": False
         }
 
-        price_filter = self.parse_price_filter(user_message)
-        status_filter = self.parse_status_filter(user_message)
-
-        product_keywords = ["sản phẩm", "mua", "giá", "product", "price", "tìm kiếm", "tìm", "search"]
-        lower_msg = user_message.lower()
-        if any(keyword in lower_msg for keyword in product_keywords):
-            products = self.api_service.get_products()
-            if products:
-                products = self.apply_product_filters(products, price_filter, status_filter)
-            if products:
-                context["products"] = products
-                context["products_info"] = self.format_products_info(products)
-
-        shop_keywords = ["cửa hàng", "shop", "store", "bán hàng", "địa chỉ", "bán những gì", "bán gì"]
-        if any(keyword in lower_msg for keyword in shop_keywords):
-            shops = self.api_service.get_shops()
-            if shops:
-                context["shops"] = shops
-                context["shops_info"] = self.format_shops_info(shops)
-                matched = None
-                for shop in shops:
-                    shop_name = str(shop.get('shopName') or shop.get('name') or '').strip()
-                    if shop_name and shop_name.lower() in lower_msg:
-                        matched = shop
-                        break
-                if not matched:
-                    possible_names = [str(s.get('shopName') or s.get('name') or '').strip() for s in shops]
-                    possible_names = [n for n in possible_names if n]
-                    best_name = None
-                    best_ratio = 0.0
-                    for name in possible_names:
-                        ratio = difflib.SequenceMatcher(None, name.lower(), lower_msg).ratio()
-                        if ratio > best_ratio:
-                            best_ratio = ratio
-                            best_name = name
-                    if best_ratio >= 0.6 and best_name:
-                        for s in shops:
-                            if (s.get('shopName') or s.get('name')) == best_name:
-                                matched = s
-                                break
-                if matched:
-                    context["matched_shop"] = matched
-                    shop_id = matched.get('id')
-                    if shop_id:
-                        shop_products = self.api_service.get_products_by_shop(shop_id)
-                        if shop_products:
-                            shop_products = self.apply_product_filters(shop_products, price_filter, status_filter)
-                        if shop_products:
-                            limited = shop_products[:10]
-                            context["products"] = limited
-                            context["products_info"] = (
-                                "SẢN PHẨM CỦA CỬA HÀNG: "
-                                + (matched.get('shopName') or matched.get('name') or '')
-                                + "\n" + self.format_products_info(limited)
-                            )
-                        else:
-                            context["products_info"] = (
-                                "Chưa tìm thấy sản phẩm nào cho cửa hàng "
-                                + (matched.get('shopName') or matched.get('name') or '')
-                            )
-        flash_keywords = [
-            "flash sale", "flashsale", "flash-sales", "deal sốc", "giờ vàng", "sale sốc", "sale giờ vàng",
-            "giảm giá nhanh", "chớp nhoáng", "deal hot", "deal hôm nay"
-        ]
-        if any(k in lower_msg for k in flash_keywords):
-            flash_sales = self.api_service.get_current_flash_sales()
-            if flash_sales:
-                context["flash_sales"] = flash_sales
-                context["flash_sales_info"] = self.format_flash_sales_info(flash_sales)
-            else:
-                context["flash_sales_info"] = "Hiện tại chưa có chương trình flash sale đang diễn ra."    
+    async def _fetch_with_timeout(self, name: str, coro: Awaitable[Any]) -> Any:
+        """Chờ một nguồn context tối đa context_fetch_timeout giây; None nếu quá hạn"""
+        try:
+            return await asyncio.wait_for(coro, timeout=self.context_fetch_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Context fetch '{name}' timed out after {self.context_fetch_timeout}s")
+            return None
+
+    async def _get_shop_context(self, query: ParsedQuery) -> Optional[tuple]:
+        """Lấy danh sách shop, tìm shop được nhắc tới và sản phẩm của shop đó.
+        Trả về (shops, matched_shop, shop_products); shop_products là None nếu không lấy được kịp."""
+        shops = await self._fetch_with_timeout("shops", self.api_service.get_shops())
+        if not shops:
+            return None
+        if self._shop_index is None or self._shop_index.shops is not shops:
+            # Dựng index cho danh sách shop mới trong thread để không chặn event loop
+            await asyncio.to_thread(self._get_shop_index, shops)
+        matched = self.match_shop(shops, query)
+        shop_products = None
+        if matched and matched.get('id'):
+            shop_products = await self._fetch_with_timeout(
+                "products_by_shop", self.api_service.get_products_by_shop(matched.get('id'))
+            )
+        return shops, matched, shop_products
+
+    def _get_shop_index(self, shops: List[Dict]) -> ShopNameIndex:
+        """Index tên shop, chỉ dựng lại khi danh sách shop trong cache được làm mới"""
+        index = self._shop_index
+        if index is None or index.shops is not shops:
+            index = ShopNameIndex(shops, min_score=SHOP_MATCH_MIN_SCORE)
+            self._shop_index = index
+        return index
+
+    def match_shop(self, shops: List[Dict], query: Any) -> Optional[Dict]:
+        """Tìm shop được nhắc tới trong tin nhắn (khớp chính xác tên, sau đó so khớp trigram gần đúng).
+        Ưu tiên các cụm đứng sau "shop" / "cửa hàng", sau đó mới xét cả tin nhắn."""
+        if isinstance(query, str):
+            query = self.parse_query(query)
+        index = self._get_shop_index(shops)
+        for mention in query.shop_mentions:
+            matched = index.match(mention)
+            if matched:
+                return matched
+        return index.match(query.normalized)
 
-        return context
     def parse_price_filter(self, message: str) -> Dict[str, Optional[float]]:
-        """Detect price range in message. Supports patterns: 'dưới 100k', 'trên 200k', 'từ 100k đến 300k', '100k-300k'"""
-        m = message.lower()
-        def to_number(token: str):
-            token = token.strip().lower().replace('.', '').replace(',', '')
-            mult = 1
-            if token.endswith('k'):
-                mult = 1000
-                token = token[:-1]
-            try:
-                return float(token) * mult
-            except ValueError:
-                return None
-        range_patterns = [r"(\d+\s*k)\s*[-đếnto]{1,4}\s*(\d+\s*k)", r"từ\s*(\d+\s*k)\s*(?:đến|tới|-)\s*(\d+\s*k)"]
-        for pat in range_patterns:
-            r = re.search(pat, m)
-            if r:
-                v1 = to_number(r.group(1))
-                v2 = to_number(r.group(2))
-                if v1 and v2:
-                    return {"min": min(v1, v2), "max": max(v1, v2)}
-        r = re.search(r"dưới\s*(\d+\s*k)", m)
-        if r:
-            v = to_number(r.group(1))
-            if v:
-                return {"min": None, "max": v}
-        r = re.search(r"trên\s*(\d+\s*k)", m)
-        if r:
-            v = to_number(r.group(1))
-            if v:
-                return {"min": v, "max": None}
-        return {"min": None, "max": None}
+        """Detect price range in message. Supports patterns: 'dưới 100k', 'trên 2 triệu', 'từ 100k đến 300k', '1-2tr', '150.000đ'"""
+        return self.parse_query(message).price_filter
 
     def parse_status_filter(self, message: str) -> Optional[str]:
-        m = message.lower()
-        if "còn hàng" in m or "in stock" in m:
-            return "in_stock"
-        if "hết hàng" in m or "out of stock" in m:
-            return "out_of_stock"
-        if "đang giảm" in m or "sale" in m or "khuyến mãi" in m:
-            return "on_sale"
-        return None
+        return self.parse_query(message).status
 
     def apply_product_filters(self, products: List[Dict], price_filter: Dict[str, Optional[float]], status_filter: Optional[str]) -> List[Dict]:
-        def price_of(p: Dict):
-            for key in ["finalPrice", "basePrice", "price"]:
-                if key in p and isinstance(p[key], (int, float)):
-                    return p[key]
-                if key in p:
-                    try:
-                        return float(str(p[key]).replace(',', '').replace('.', ''))
-                    except Exception:
-                        continue
-            return None
-        filtered = []
-        for p in products:
-            price = price_of(p)
-            if price_filter["min"] is not None and (price is None or price < price_filter["min"]):
-                continue
-            if price_filter["max"] is not None and (price is None or price > price_filter["max"]):
-                continue
-            if status_filter:
-                status_val = str(p.get('status', p.get('isActive', p.get('inStock', '')))).lower()
-                if status_filter == "in_stock" and status_val in ["false", "0", "out", "hết", "inactive"]:
-                    continue
-                if status_filter == "out_of_stock" and status_val in ["true", "1", "active", "còn"]:
-                    continue
-                if status_filter == "on_sale":
-                    base = p.get('basePrice') or p.get('price')
-                    final = p.get('finalPrice') or base
-                    try:
-                        if final is None or base is None or float(final) >= float(base):
-                            continue
-                    except Exception:
-                        continue
-            filtered.append(p)
+        """Lọc sản phẩm theo giá / tình trạng trên ProductStore dạng cột (dựng một lần mỗi lần làm mới catalog)"""
+        if not products:
+            return products
+        store = self.product_stores.get(products)
+        filtered = store.filter(price_filter["min"], price_filter["max"], status_filter)
         return filtered or products
 
-    def get_additional_context(self, message: str) -> str:
-        m = message.lower()
+    async def retrieve_products(self, products: List[Dict], user_message: str, price_filter: Dict[str, Optional[float]], status_filter: Optional[str], top_k: int) -> List[Dict]:
+        """Chọn top-k sản phẩm cho prompt theo PRODUCT_RETRIEVAL_MODE.
+
+        keyword: BM25, vector: ANN trên chroma_db, hybrid: chạy song song cả hai rồi gộp bằng
+        reciprocal-rank fusion. Kết quả đã lọc giá / tình trạng, không trùng lặp và tối đa top_k;
+        không index nào khớp thì giữ thứ tự catalog. Độ trễ từng stage được ghi vào retrieval_latency."""
+        if not products:
+            return products
+        started = time.perf_counter()
+        # Lần đầu gặp một catalog mới sẽ dựng store (và index BM25), nên chạy trong thread
+        store = await asyncio.to_thread(self.product_stores.get, products)
+        mask = store.candidate_mask(price_filter["min"], price_filter["max"], status_filter)
+        depth = top_k * RETRIEVAL_CANDIDATE_MULTIPLIER
+
+        async def keyword_stage() -> List[int]:
+            if self.retrieval_mode not in ("keyword", "hybrid"):
+                return []
+            with self.retrieval_latency.measure("keyword"):
+                return await asyncio.to_thread(store.keyword_ranking, user_message, depth, mask)
+
+        async def vector_stage() -> List[int]:
+            if self.retrieval_mode not in ("vector", "hybrid") or not self.vector_index.available:
+                return []
+            try:
+                with self.retrieval_latency.measure("vector"):
+                    hits = await asyncio.to_thread(self.vector_index.search, user_message, depth)
+            except Exception as e:
+                logger.error(f"Vector search failed: {e}")
+                return []
+            return store.positions([pid for pid, similarity in hits if similarity > VECTOR_MIN_SIMILARITY], mask)
+
+        rankings = [r for r in await asyncio.gather(keyword_stage(), vector_stage()) if r]
+        with self.retrieval_latency.measure("fusion"):
+            if len(rankings) > 1:
+                selected = [pos for pos, _ in reciprocal_rank_fusion(rankings, top_k, RRF_K)]
+            else:
+                selected = rankings[0][:top_k] if rankings else []
+        result = store.take(selected) or store.head(mask, top_k)
+        self.retrieval_latency.record("total", (time.perf_counter() - started) * 1000)
+        return result
+
+    def _schedule_vector_sync(self, products: List[Dict]):
+        """Đồng bộ vector index ở background khi catalog sản phẩm được làm mới"""
+        if self.retrieval_mode == "keyword" or not self.vector_index.available:
+            return
+        if products is self._vector_synced_products or (self._vector_sync_task and not self._vector_sync_task.done()):
+            return
+        self._vector_synced_products = products
+
+        async def run_sync():
+            try:
+                await asyncio.to_thread(self.vector_index.sync, products)
+            except Exception as e:
+                logger.error(f"Vector index sync failed: {e}")
+                self._vector_synced_products = None
+
+        self._vector_sync_task = asyncio.ensure_future(run_sync())
+
+    def get_additional_context(self, message: str, query: Optional[ParsedQuery] = None) -> str:
+        if query is None:
+            query = self.parse_query(message)
         snippets = []
         
         # Check for policy-related questions first
-        policy_keywords = [
-            'chính sách', 'policy', 'quy định', 'điều khoản', 'quy tắc',
-            'mua hàng', 'bán hàng', 'đặt hàng', 'thanh toán', 'giao hàng',
-            'vận chuyển', 'đổi trả', 'hoàn tiền', 'mở shop', 'đăng ký shop',
-            'vi phạm', 'xử lý vi phạm', 'trách nhiệm', 'nghĩa vụ'
-        ]
-        
-        if any(k in m for k in policy_keywords):
-            policy_info = search_policy(message)
+        if query.has_intent("policy"):
+            if POLICY_CONTEXT_MODE == "sections":
+                policy_info = search_policy_sections(message, POLICY_CONTEXT_MAX_SECTIONS, POLICY_CONTEXT_MAX_CHARS)
+            else:
+                policy_info = search_policy(message, query.keywords("policy_section"))
             if policy_info:
                 snippets.append(f"CHÍNH SÁCH STREAMCART:\n{policy_info}")
         
         # Existing knowledge base
-        kb = [
-            (['thanh toán', 'payment', 'trả tiền'], "Phương thức thanh toán: hỗ trợ ví điện tử, thẻ ngân hàng nội địa và quốc tế, COD tùy khu vực."),
-            (['vận chuyển', 'giao hàng', 'ship'], "Vận chuyển: đối tác giao hàng tiêu chuẩn 2-5 ngày làm việc, có tuỳ chọn nhanh ở một số tỉnh."),
-            (['đổi trả', 'hoàn hàng', 'trả hàng', 'refund'], "Đổi trả: chấp nhận trong 7 ngày nếu sản phẩm lỗi / sai mô tả, cần video & ảnh khi nhận hàng."),
-            (['khuyến mãi', 'mã giảm', 'voucher', 'giảm giá'], "Khuyến mãi: nhập mã tại bước thanh toán; mỗi đơn áp dụng tối đa 1 mã + freeship nếu đủ điều kiện."),
-            (['hỗ trợ', 'support', 'liên hệ', 'care'], "Hỗ trợ: bạn có thể gửi câu hỏi qua mục Trợ giúp hoặc chat trực tiếp trong khung giờ 8h-22h."),
-            (['đơn hàng', 'tình trạng đơn', 'tracking', 'mã đơn'], "Theo dõi đơn: vào mục 'Đơn hàng của tôi' để xem trạng thái cập nhật thời gian thực."),
-            (['flash sale', 'deal sốc', 'giờ vàng', 'sale giờ vàng', 'flashsale'], "Flash Sale: diễn ra trong khung giờ giới hạn, số lượng có hạn, nên thanh toán sớm để giữ mức giá ưu đãi.")
-        ]
-        for keys, text in kb:
-            if any(k in m for k in keys):
+        for i, (_, text) in enumerate(KNOWLEDGE_BASE):
+            if query.has_intent(f"kb:{i}"):
                 snippets.append(text)
         return "\n\n".join(snippets)
     
-    def format_products_info(self, products: List[Dict]) -> str:
-        """Format products information for prompt"""
+    def format_products_info(self, products: List[Dict], top_k: int = PRODUCT_CONTEXT_TOP_K) -> str:
+        """Format products information for prompt (tối đa top_k sản phẩm)"""
         if not products:
             return "Không có sản phẩm nào."
         
         formatted = "DANH SÁCH SẢN PHẨM:\n"
-        limited_products = products[:5] if len(products) > 5 else products
+        limited_products = products[:top_k]
         
         for i, product in enumerate(limited_products, 1):
             name = product.get('productName', product.get('name', 'N/A'))
             price = product.get('finalPrice', product.get('basePrice', product.get('price', 'N/A')))
-            description = product.get('description', 'N/A')
+            description = truncate_text(str(product.get('description', 'N/A')), PROMPT_DESCRIPTION_MAX_CHARS)
             
             formatted += f"{i}. Tên: {name}\n"
             formatted += f"   Giá: {price}\n"
@@ -562,15 +1247,11 @@ class ChatbotService:
         
         return formatted
 
-    def is_out_of_scope(self, message: str) -> bool:
+    def is_out_of_scope(self, message: str, query: Optional[ParsedQuery] = None) -> bool:
         """Rất đơn giản: phát hiện một số chủ đề ngoài phạm vi để từ chối sớm."""
-        oos_keywords = [
-            "thời tiết", "weather", "chính trị", "politics", "bóng đá", "football",
-            "crypto", "tiền ảo", "coin", "chứng khoán", "stock", "forex", "tiểu sử",
-            "life story", "tiểu thuyết", "game", "anime", "phim", "movie"
-        ]
-        m_lower = message.lower()
-        return any(k in m_lower for k in oos_keywords)
+        if query is None:
+            query = self.parse_query(message)
+        return query.has_intent("out_of_scope")
     
     def format_shops_info(self, shops: List[Dict]) -> str:
         """Format shops information for prompt"""
@@ -582,7 +1263,7 @@ class ChatbotService:
         
         for i, shop in enumerate(limited_shops, 1):
             name = shop.get('shopName', shop.get('name', 'N/A'))
-            description = shop.get('description', 'N/A')
+            description = truncate_text(str(shop.get('description', 'N/A')), PROMPT_DESCRIPTION_MAX_CHARS)
             status = shop.get('status', 'N/A')
             approval_status = shop.get('approvalStatus', 'N/A')
             
@@ -617,38 +1298,229 @@ class ChatbotService:
             formatted += f"   Số lượng: còn {qty_avail} đã bán {qty_sold}; Slot: {slot}; Kết thúc: {end_time}\n"
         return formatted
     
-    async def process_message(self, message: str, user_id: str = None, session_id: str = None, context: str = "") -> str:
-        """Process user message and generate response using Gemini"""
+    def _pipeline_stages(self) -> List[PipelineStage]:
+        return [
+            PipelineStage("normalize", self._stage_normalize),
+            PipelineStage("scope_guard", self._stage_scope_guard, ("normalize",)),
+            PipelineStage("intent", self._stage_intent, ("normalize",)),
+            PipelineStage("retrieval", self._stage_retrieval, ("normalize",)),
+            PipelineStage("prompt", self._stage_prompt),
+            PipelineStage("cache", self._stage_cache, ("normalize", "prompt")),
+            PipelineStage("generate", self._stage_generate, ("prompt",)),
+            PipelineStage("persist", self._stage_persist, ("generate",), always=True),
+        ]
+
+    async def _stage_normalize(self, state: ChatState):
+        """Phân tích tin nhắn một lần (chuẩn hoá, intent, giá, trạng thái, tên shop)"""
+        state.query = self.parse_query(state.message)
+        state.question = normalize_question(state.query.normalized)
+
+    async def _stage_scope_guard(self, state: ChatState):
+        """Từ chối câu hỏi ngoài phạm vi trước khi gọi backend"""
+        if self.is_out_of_scope(state.message, state.query):
+            state.respond(OUT_OF_SCOPE_ANSWER, "scope_guard")
+
+    async def _stage_intent(self, state: ChatState):
+        """Context cục bộ theo intent: chính sách và knowledge base"""
+        state.extra_context = self.get_additional_context(state.message, state.query)
+
+    async def _stage_retrieval(self, state: ChatState):
+        state.context = await self.get_relevant_context(state.message, state.query)
+
+    async def _stage_prompt(self, state: ChatState):
+        context = state.context or self.empty_context()
+        state.prompt, state.packed = self.prompt_service.build_main_prompt(
+            user_message=state.message,
+            products_info=context["products_info"],
+            shops_info=context["shops_info"],
+            flash_sales_info=context.get("flash_sales_info", ""),
+            context="",
+            extra_info=state.extra_context
+        )
+
+    async def _stage_cache(self, state: ChatState):
+        """Tra cache chính xác rồi cache ngữ nghĩa theo câu hỏi + context trong prompt"""
+        # Không cache câu trả lời dựa trên context thiếu nguồn (timeout / backend lỗi)
+        if state.context and state.context.get("degraded"):
+            return
+        sections = {name: text for name, text in state.packed.sections.items() if name != "question"}
+        log_prefix = f"User: {state.user_id}, Session: {state.session_id}, Message: {state.message[:50]}..."
+        if self.answer_cache is not None:
+            state.fingerprint = answer_fingerprint(state.question, sections)
+            cached = self.answer_cache.get(state.fingerprint)
+            if cached is not None:
+                logger.info(f"Chat answered from cache - {log_prefix}")
+                state.respond(cached, "cache")
+                return
+        if self.semantic_cache is not None:
+            # Chỉ so với câu hỏi đã trả lời có cùng intent và cùng context trong prompt
+            state.scope = answer_fingerprint(",".join(sorted(state.query.intents)), sections)
+            hit = await asyncio.to_thread(self.semantic_cache.get, state.question, state.scope)
+            if hit is not None:
+                logger.info(
+                    f"Chat answered from semantic cache - {log_prefix} "
+                    f"matched='{hit.matched_question[:50]}' similarity={hit.similarity:.3f}"
+                )
+                state.respond(hit.answer, "cache")
+
+    async def _stage_generate(self, state: ChatState):
+        started = time.perf_counter()
+        state.answer = await self.generate(state.prompt, state.priority, state.deadline)
+        state.generate_ms = (time.perf_counter() - started) * 1000
+
+    async def _stage_persist(self, state: ChatState):
+        """Lưu tin nhắn vào lịch sử session; câu trả lời Gemini vừa sinh còn được lưu vào cache"""
+        if state.answered_by is None:
+            await self.store_answer(state, state.answer, state.generate_ms)
+        if self.sessions is not None and state.session_id:
+            self.sessions.save_message(state.session_id, state.message, state.answer)
+
+    async def prepare_answer(self, message: str, user_id: str = None, session_id: str = None, deadline: Optional[float] = None, priority: str = "anonymous") -> ChatState:
+        """Chạy các stage trước generate: state.answer khác None nếu đã có câu trả lời (ngoài phạm vi / cache)"""
+        state = ChatState(message, user_id, session_id, deadline, priority)
+        return await self.pipeline.run(state, stop_before="generate")
+
+    async def store_answer(self, state: ChatState, answer: str, generate_ms: float):
+        """Lưu câu trả lời Gemini vừa sinh vào cache chính xác và cache ngữ nghĩa"""
+        if state.fingerprint is not None:
+            self.answer_cache.set(state.fingerprint, answer, generate_ms)
+        if state.scope is not None:
+            await asyncio.to_thread(self.semantic_cache.set, state.question, state.scope, answer)
+
+    async def generate(self, prompt: str, priority: str = "anonymous", deadline: Optional[float] = None) -> str:
+        """Gọi Gemini trong executor riêng (không chặn event loop) khi admission controller cấp slot"""
+        async with self.llm_limiter.slot(priority, deadline):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.llm_executor, lambda: model.generate_content(prompt).text)
+
+    async def process_message(self, message: str, user_id: str = None, session_id: str = None, context: str = "", deadline: Optional[float] = None, priority: str = "anonymous") -> str:
+        """Process user message and generate response using Gemini (deadline theo time.monotonic())"""
         try:
-            api_context = self.get_relevant_context(message)
-            if self.is_out_of_scope(message):
-                return (
-                    "Xin lỗi, tôi chỉ hỗ trợ các câu hỏi liên quan đến nền tảng StreamCart như sản phẩm, cửa hàng, giá, đặt hàng và hỗ trợ sử dụng. "
-                    "Bạn có thể hỏi: 'Có những cửa hàng nào?', 'Giá sản phẩm A?', 'Cách mua hàng?'"
+            state = await self.pipeline.run(ChatState(message, user_id, session_id, deadline, priority))
+            if state.answered_by is None:
+                packed = state.packed
+                logger.info(
+                    f"Chat processed - User: {user_id}, Session: {session_id}, Message: {message[:50]}... "
+                    f"prompt_tokens~{packed.tokens} truncated={list(packed.truncated)} dropped={list(packed.dropped)} "
+                    f"stages_ms={state.timings}"
                 )
-            extra_context = self.get_additional_context(message)
-            combined_products_info = api_context["products_info"]
-            if extra_context:
-                combined_products_info += "\n\nTHÔNG TIN THÊM:\n" + extra_context
-            prompt = self.prompt_service.create_main_prompt(
-                user_message=message,
-                products_info=combined_products_info,
-                shops_info=api_context["shops_info"],
-                flash_sales_info=api_context.get("flash_sales_info", ""),
-                context=""
-            )
-            response = model.generate_content(prompt)
-            logger.info(f"Chat processed - User: {user_id}, Session: {session_id}, Message: {message[:50]}...")
+            else:
+                logger.info(f"Chat answered by '{state.answered_by}' stage - User: {user_id}, Session: {session_id}, stages_ms={state.timings}")
             
-            return response.text
+            return state.answer
             
         except Exception as e:
+            if isinstance(e, LLMOverloadedError) or is_rate_limit_error(e):
+                raise self.busy_error(e, user_id)
             logger.error(f"Error processing message: {e}")
             raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
+    def busy_error(self, error: Exception, user_id: str = None) -> HTTPException:
+        """503 + Retry-After khi bị từ chối vì quá tải / deadline hoặc Gemini trả 429, để client lùi lại thay vì thử lại ngay"""
+        retry_after = error.retry_after if isinstance(error, LLMOverloadedError) else self.llm_limiter.backoff_cooldown
+        logger.warning(f"Gemini busy, rejecting message - User: {user_id}: {error}")
+        return HTTPException(
+            status_code=503,
+            detail=f"Chatbot is busy, please retry later: {str(error)}",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    async def stream_answer(self, state: ChatState) -> AsyncIterator[str]:
+        """Stage generate (và persist) cho /chat/stream: giữ slot Gemini rồi trả iterator các đoạn câu trả lời
+        (stream=True); câu trả lời có sẵn (state đã qua prepare_answer) được trả một lần.
+
+        Slot được lấy trước khi trả về nên quá tải báo lỗi (LLMOverloadedError) trước khi stream bắt đầu.
+        Vòng lặp đọc stream của SDK là blocking nên chạy trong executor Gemini, các đoạn về event loop qua Queue;
+        slot được trả khi Gemini sinh xong, kể cả khi client đã ngắt kết nối."""
+        if state.answer is not None:
+            async def cached():
+                yield state.answer
+                if "persist" in self.pipeline.order:
+                    await self._stage_persist(state)
+            return cached()
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        def produce() -> Optional[Exception]:
+            error = None
+            try:
+                for chunk in model.generate_content(state.prompt, stream=True):
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunk không có text (vd. bị safety filter chặn)
+                        continue
+                    if text:
+                        loop.call_soon_threadsafe(chunks.put_nowait, text)
+            except Exception as e:
+                error = e
+                loop.call_soon_threadsafe(chunks.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+            return error
+
+        await self.llm_limiter.acquire(state.priority, state.deadline)
+        started = time.perf_counter()
+        try:
+            producer = loop.run_in_executor(self.llm_executor, produce)
+        except Exception as e:
+            self.llm_limiter.release(error=e)
+            raise
+
+        def release(future: asyncio.Future):
+            # produce() trả về lỗi thay vì raise; 429 giữa chừng stream cũng làm giảm số lời gọi đồng thời
+            error = None if future.cancelled() else (future.exception() or future.result())
+            self.llm_limiter.release(duration=time.perf_counter() - started, error=error)
+
+        producer.add_done_callback(release)
+
+        async def stream():
+            parts: List[str] = []
+            first_chunk_ms = None
+            while True:
+                item = await chunks.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - started) * 1000
+                parts.append(item)
+                yield item
+            state.answer = "".join(parts)
+            state.generate_ms = (time.perf_counter() - started) * 1000
+            state.timings["generate"] = round(state.generate_ms, 1)
+            self.pipeline.latency.record("generate", state.generate_ms)
+            packed = state.packed
+            logger.info(
+                f"Chat streamed - User: {state.user_id}, Session: {state.session_id}, chunks={len(parts)} "
+                f"prompt_tokens~{packed.tokens} truncated={list(packed.truncated)} dropped={list(packed.dropped)} "
+                f"first_chunk_ms={first_chunk_ms or 0:.0f} stages_ms={state.timings}"
+            )
+            if "persist" in self.pipeline.order:
+                await self._stage_persist(state)
+
+        return stream()
+
 # Instantiate services at module level (outside class definition)
-chatbot_service = ChatbotService()
 user_session_manager = UserSession()
+chatbot_service = ChatbotService(sessions=user_session_manager)
+
+@app.on_event("startup")
+async def startup_event():
+    """Khởi tạo connection pool tới backend và nạp snapshot catalog"""
+    if not BACKEND_SHARED_SECRET:
+        logger.warning(
+            "BACKEND_SHARED_SECRET is not set: requests from Backend C# (user_id in body) cannot be verified "
+            "and are queued for Gemini as anonymous. Set it and send it in the X-Internal-Token header."
+        )
+    await chatbot_service.api_service.startup()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Ghi snapshot catalog và đóng connection pool tới backend"""
+    await chatbot_service.api_service.shutdown()
+    chatbot_service.llm_executor.shutdown(wait=False)
 
 @app.get("/")
 async def root():
@@ -659,26 +1531,49 @@ async def root():
         "status": "active"
     }
 
+def is_trusted_backend(http_request: Request) -> bool:
+    """Request từ Backend C#: header X-Internal-Token khớp BACKEND_SHARED_SECRET"""
+    token = http_request.headers.get("x-internal-token", "")
+    return bool(BACKEND_SHARED_SECRET) and hmac.compare_digest(token.encode("utf-8"), BACKEND_SHARED_SECRET.encode("utf-8"))
+
+def resolve_chat_session(request: ChatRequest, http_request: Request) -> tuple:
+    """(user_id, session_id, priority): user_id từ Backend C# hoặc từ Authorization header.
+
+    Lớp ưu tiên Gemini chỉ dựa vào đường xác thực (bearer token hợp lệ hoặc Backend C# có secret),
+    không dựa vào user_id trong body mà client nào cũng tự gửi được."""
+    authenticated = user_session_manager.is_authenticated(http_request.headers.get("authorization", ""))
+    if request.user_id:
+        user_id = request.user_id
+        session_id = f"user_{user_id}_main"
+        trusted = is_trusted_backend(http_request)
+        authenticated = authenticated or trusted
+        logger.info(f"Processing chat from Backend C# - User: {user_id}" + ("" if trusted else " (caller not verified)"))
+    else:
+        user_id, session_id = user_session_manager.get_or_create_session(
+            dict(http_request.headers)
+        )
+        logger.info(f"Processing direct chat - User: {user_id}")
+    return user_id, session_id, priority_class(authenticated)
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest, http_request: Request):
     """Main chat endpoint - Simplified với chỉ user_id"""
     try:
-        if request.user_id:
-            user_id = request.user_id
-            session_id = f"user_{user_id}_main"
-            logger.info(f"Processing chat from Backend C# - User: {user_id}")
-        else:
-            user_id, session_id = user_session_manager.get_or_create_session(
-                dict(http_request.headers)
-            )
-            logger.info(f"Processing direct chat - User: {user_id}")
+        started = time.perf_counter()
+        deadline = time.monotonic() + GEMINI_REQUEST_DEADLINE_SECONDS
+        user_id, session_id, priority = resolve_chat_session(request, http_request)
         response = await chatbot_service.process_message(
             message=request.message,
             user_id=user_id,
             session_id=session_id,
-            context=""
+            context="",
+            deadline=deadline,
+            priority=priority
         )
-        user_session_manager.save_message(session_id, request.message, response)
+        chatbot_service.chat_latency.record("chat_total", (time.perf_counter() - started) * 1000)
         
         return ChatResponse(
             response=response,
@@ -696,11 +1591,61 @@ async def chat_endpoint(request: ChatRequest, http_request: Request):
             error=str(e)
         )
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """Chat endpoint dạng Server-Sent Events: gửi từng đoạn câu trả lời ngay khi Gemini sinh ra.
+
+    Events: start {user_id} -> delta {text} ... -> done {status, user_id, ttfb_ms, total_ms} (hoặc error {error})"""
+    started = time.perf_counter()
+    deadline = time.monotonic() + GEMINI_REQUEST_DEADLINE_SECONDS
+    user_id, session_id, priority = resolve_chat_session(request, http_request)
+    try:
+        # Lỗi trước khi stream bắt đầu (kể cả quá tải) vẫn trả HTTP status như /chat
+        state = await chatbot_service.prepare_answer(request.message, user_id, session_id, deadline, priority)
+        chunks = await chatbot_service.stream_answer(state)
+    except LLMOverloadedError as e:
+        raise chatbot_service.busy_error(e, user_id)
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+        raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
+
+    async def events():
+        yield sse_event("start", {"user_id": user_id})
+        ttfb_ms = None
+        try:
+            async for text in chunks:
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - started) * 1000
+                    chatbot_service.chat_latency.record("stream_ttfb", ttfb_ms)
+                yield sse_event("delta", {"text": text})
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {e}")
+            error = {"status": "error", "error": str(e)}
+            if is_rate_limit_error(e):
+                error["retry_after"] = chatbot_service.llm_limiter.backoff_cooldown
+            yield sse_event("error", error)
+            return
+        total_ms = (time.perf_counter() - started) * 1000
+        chatbot_service.chat_latency.record("stream_total", total_ms)
+        yield sse_event("done", {
+            "status": "success",
+            "user_id": user_id,
+            "ttfb_ms": round(ttfb_ms or total_ms, 1),
+            "total_ms": round(total_ms, 1),
+        })
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Tắt buffer của proxy (nginx) để từng event tới client ngay
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.get("/products")
 async def get_products():
     """Get all products from backend API"""
     try:
-        products = chatbot_service.api_service.get_products()
+        products = await chatbot_service.api_service.get_products()
         return {"products": products, "count": len(products)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -709,7 +1654,7 @@ async def get_products():
 async def get_shops():
     """Get all shops from backend API"""
     try:
-        shops = chatbot_service.api_service.get_shops()
+        shops = await chatbot_service.api_service.get_shops()
         return {"shops": shops, "count": len(shops)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -718,7 +1663,7 @@ async def get_shops():
 async def get_shop_by_id(shop_id: str):
     """Get specific shop by ID"""
     try:
-        shop = chatbot_service.api_service.get_shop_by_id(shop_id)
+        shop = await chatbot_service.api_service.get_shop_by_id(shop_id)
         if not shop:
             raise HTTPException(status_code=404, detail="Shop not found")
         return shop
@@ -731,7 +1676,7 @@ async def get_shop_by_id(shop_id: str):
 async def get_products_by_shop(shop_id: str, activeOnly: bool = True):
     """Get products of a specific shop"""
     try:
-        products = chatbot_service.api_service.get_products_by_shop(shop_id, active_only=activeOnly)
+        products = await chatbot_service.api_service.get_products_by_shop(shop_id, active_only=activeOnly)
         return {"shop_id": shop_id, "count": len(products), "products": products}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -740,7 +1685,7 @@ async def get_products_by_shop(shop_id: str, activeOnly: bool = True):
 async def get_current_flash_sales():
     """Get current flash sales"""
     try:
-        flash_sales = chatbot_service.api_service.get_current_flash_sales()
+        flash_sales = await chatbot_service.api_service.get_current_flash_sales()
         return {"count": len(flash_sales), "flash_sales": flash_sales}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -773,10 +1718,15 @@ async def get_sales_policies():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/policies/search")
-async def search_policies(q: str):
-    """Search for specific policy information"""
+async def search_policies(q: str, mode: str = "full", max_sections: int = POLICY_CONTEXT_MAX_SECTIONS, max_chars: int = POLICY_CONTEXT_MAX_CHARS):
+    """Search for specific policy information.
+    mode=full: toàn bộ văn bản chính sách khớp từ khoá; mode=sections: chỉ các mục liên quan nhất trong max_chars ký tự"""
     try:
-        from policies import search_policy
+        if mode == "sections":
+            found = find_policy_sections(q, max_sections, max_chars)
+            result = format_policy_sections(found)
+            sections = [s.heading or s.title for s in found]
+            return {"query": q, "mode": mode, "sections": sections, "chars": len(result), "policy": result}
         result = search_policy(q)
         return {"query": q, "policy": result}
     except Exception as e:
@@ -878,6 +1828,25 @@ async def get_user_sessions(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime metrics của chatbot service"""
+    return {
+        "backend": chatbot_service.api_service.get_metrics(),
+        "cache": APIService._cache.stats(),
+        "vector_index": chatbot_service.vector_index.stats(),
+        "prompt": chatbot_service.prompt_service.size_stats.summary(),
+        "answer_cache": chatbot_service.answer_cache.stats() if chatbot_service.answer_cache else None,
+        "semantic_cache": chatbot_service.semantic_cache.stats() if chatbot_service.semantic_cache else None,
+        "chat": chatbot_service.chat_latency.summary(),
+        "llm": chatbot_service.llm_limiter.stats(),
+        "pipeline": chatbot_service.pipeline.stats(),
+        "retrieval": {
+            "mode": chatbot_service.retrieval_mode,
+            "latency": chatbot_service.retrieval_latency.summary(),
+        },
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
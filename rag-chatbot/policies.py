@@ -4,6 +4,12 @@ StreamCart Platform Policies
 Chính sách Mua hàng và Bán hàng của nền tảng StreamCart
 """
 
+import re
+from typing import List, NamedTuple
+
+from prompt_budget import truncate_text
+from search_index import BM25Index
+
 PURCHASE_POLICY = """
 🛒 CHÍNH SÁCH MUA HÀNG
 
@@ -113,36 +119,117 @@ def get_full_policy():
     """Lấy toàn bộ chính sách"""
     return f"{PURCHASE_POLICY}\n\n{SALES_POLICY}\n\n{GENERAL_TERMS}"
 
-def search_policy(query: str) -> str:
-    """Tìm kiếm thông tin chính sách dựa trên từ khóa"""
-    query_lower = query.lower()
-    
-    # Mapping keywords to specific policy sections
-    policy_keywords = {
-        'mua hàng': PURCHASE_POLICY,
-        'đặt hàng': PURCHASE_POLICY,
-        'thanh toán': PURCHASE_POLICY,
-        'giao hàng': PURCHASE_POLICY,
-        'vận chuyển': PURCHASE_POLICY,
-        'đổi trả': PURCHASE_POLICY,
-        'hoàn tiền': PURCHASE_POLICY,
-        'bán hàng': SALES_POLICY,
-        'mở shop': SALES_POLICY,
-        'đăng ký shop': SALES_POLICY,
-        'quản lý sản phẩm': SALES_POLICY,
-        'xử lý đơn hàng': SALES_POLICY,
-        'vi phạm': SALES_POLICY,
-        'khuyến mãi': SALES_POLICY,
-        'chính sách giá': SALES_POLICY
-    }
+# Từ khoá -> phần chính sách tương ứng
+POLICY_SECTION_KEYWORDS = {
+    'mua hàng': PURCHASE_POLICY,
+    'đặt hàng': PURCHASE_POLICY,
+    'thanh toán': PURCHASE_POLICY,
+    'giao hàng': PURCHASE_POLICY,
+    'vận chuyển': PURCHASE_POLICY,
+    'đổi trả': PURCHASE_POLICY,
+    'hoàn tiền': PURCHASE_POLICY,
+    'bán hàng': SALES_POLICY,
+    'mở shop': SALES_POLICY,
+    'đăng ký shop': SALES_POLICY,
+    'quản lý sản phẩm': SALES_POLICY,
+    'xử lý đơn hàng': SALES_POLICY,
+    'vi phạm': SALES_POLICY,
+    'khuyến mãi': SALES_POLICY,
+    'chính sách giá': SALES_POLICY
+}
+
+def search_policy(query: str, matched_keywords=None) -> str:
+    """Tìm kiếm thông tin chính sách dựa trên từ khóa.
+
+    matched_keywords: các từ khoá trong POLICY_SECTION_KEYWORDS đã được tìm thấy trước đó
+    (ví dụ bởi intent matcher) để khỏi duyệt lại câu hỏi."""
+    if matched_keywords is None:
+        query_lower = query.lower()
+        matched_keywords = {keyword for keyword in POLICY_SECTION_KEYWORDS if keyword in query_lower}
     
     # Find matching policies
     results = []
-    for keyword, policy in policy_keywords.items():
-        if keyword in query_lower and policy not in results:
+    for keyword, policy in POLICY_SECTION_KEYWORDS.items():
+        if keyword in matched_keywords and policy not in results:
             results.append(policy)
     
     if not results:
         return get_full_policy()
     
     return '\n\n'.join(results)
+
+
+class PolicySection(NamedTuple):
+    """Một mục đánh số trong văn bản chính sách (văn bản không đánh số là một mục duy nhất)"""
+    title: str
+    heading: str
+    text: str
+
+    def format(self) -> str:
+        return f"{self.title} - {self.text}" if self.heading else f"{self.title}\n{self.text}"
+
+
+_SECTION_HEADING_RE = re.compile(r"^\d+\.\s", re.MULTILINE)
+
+
+def split_policy_sections(policy: str) -> List[PolicySection]:
+    """Tách văn bản chính sách thành các mục theo dòng '1. ...', '2. ...'"""
+    lines = policy.strip().splitlines()
+    title, body = lines[0].strip(), "\n".join(lines[1:]).strip()
+    starts = [m.start() for m in _SECTION_HEADING_RE.finditer(body)]
+    if not starts:
+        return [PolicySection(title, "", body)]
+    sections = []
+    for start, end in zip(starts, starts[1:] + [len(body)]):
+        text = body[start:end].strip()
+        sections.append(PolicySection(title, text.splitlines()[0].strip(), text))
+    return sections
+
+
+# Tách và index một lần lúc import; tiêu đề mục lặp lại để được trọng số cao hơn nội dung
+POLICY_SECTIONS = [s for policy in (PURCHASE_POLICY, SALES_POLICY, GENERAL_TERMS) for s in split_policy_sections(policy)]
+_SECTION_INDEX = BM25Index([f"{s.title} {s.heading} {s.heading} {s.text}" for s in POLICY_SECTIONS])
+
+
+def find_policy_sections(query: str, max_sections: int = 3, max_chars: int = 1200) -> List[PolicySection]:
+    """Các mục liên quan nhất (BM25) tới câu hỏi, tổng độ dài không vượt max_chars
+    (mục đầu tiên luôn được giữ, bị cắt bớt nếu một mình đã dài hơn max_chars)"""
+    selected = []
+    used = 0
+    for doc_id, _ in _SECTION_INDEX.search(query, top_k=max_sections):
+        section = POLICY_SECTIONS[doc_id]
+        size = len(section.format())
+        if selected and used + size > max_chars:
+            continue
+        if size > max_chars:
+            section = section._replace(text=truncate_text(section.text, max(max_chars - (size - len(section.text)), 0)))
+            size = len(section.format())
+        selected.append(section)
+        used += size
+    return selected
+
+
+def get_policy_outline() -> str:
+    """Danh sách các mục chính sách (dùng khi câu hỏi không khớp mục nào)"""
+    lines = []
+    title = None
+    for section in POLICY_SECTIONS:
+        if section.title != title:
+            title = section.title
+            lines.append(title)
+        if section.heading:
+            lines.append(f"  {section.heading}")
+    return "\n".join(lines)
+
+
+def search_policy_sections(query: str, max_sections: int = 3, max_chars: int = 1200) -> str:
+    """Như search_policy nhưng chỉ trả về các mục liên quan trong giới hạn max_chars ký tự;
+    không khớp mục nào thì trả về mục lục chính sách thay vì toàn bộ văn bản"""
+    return format_policy_sections(find_policy_sections(query, max_sections, max_chars))
+
+
+def format_policy_sections(sections: List[PolicySection]) -> str:
+    """Văn bản của các mục đã chọn; danh sách rỗng thì trả về mục lục chính sách"""
+    if not sections:
+        return "CÁC MỤC CHÍNH SÁCH STREAMCART:\n" + get_policy_outline()
+    return "\n\n".join(section.format() for section in sections)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Product Store
+Chuẩn hoá danh sách sản phẩm một lần mỗi lần làm mới catalog thành các mảng NumPy
+để lọc theo giá / tình trạng bằng phép toán vector thay vì duyệt từng dict
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from search_index import BM25Index
+
+# Giá trị status được coi là "đang bán / còn hàng" và "ngừng bán / hết hàng"
+_STATUS_TRUE = {"true", "1", "active", "còn"}
+_STATUS_FALSE = {"false", "0", "out", "hết", "inactive"}
+_STOCK_KEYS = ["stockQuantity", "stock", "quantity", "quantityAvailable"]
+
+
+def parse_price(value: Any) -> Optional[float]:
+    """Chuyển giá (số hoặc chuỗi '150.000', '150,000') thành float"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(',', '').replace('.', ''))
+    except (TypeError, ValueError):
+        return None
+
+
+def _price_of(p: Dict) -> Optional[float]:
+    for key in ["finalPrice", "basePrice", "price"]:
+        if key in p:
+            price = parse_price(p[key])
+            if price is not None:
+                return price
+    return None
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class ProductStore:
+    """Dữ liệu sản phẩm dạng cột: giá, giá gốc / giá sau giảm, tồn kho, trạng thái và index giá đã sắp xếp"""
+
+    def __init__(self, products: List[Dict]):
+        self.products = products
+        n = len(products)
+        self.price = np.full(n, np.nan)
+        self.base_price = np.full(n, np.nan)
+        self.final_price = np.full(n, np.nan)
+        self.stock = np.full(n, np.nan)
+        # 1: đang bán, 0: ngừng bán, -1: không rõ
+        self.status = np.full(n, -1, dtype=np.int8)
+        for i, p in enumerate(products):
+            price = _price_of(p)
+            if price is not None:
+                self.price[i] = price
+            base = p.get('basePrice') or p.get('price')
+            final = p.get('finalPrice') or base
+            if base is not None and final is not None:
+                self.base_price[i] = _to_float(base)
+                self.final_price[i] = _to_float(final)
+            for key in _STOCK_KEYS:
+                if isinstance(p.get(key), (int, float)):
+                    self.stock[i] = p[key]
+                    break
+            status_val = str(p.get('status', p.get('isActive', p.get('inStock', '')))).lower()
+            if status_val in _STATUS_TRUE:
+                self.status[i] = 1
+            elif status_val in _STATUS_FALSE:
+                self.status[i] = 0
+        # Index giá: argsort ổn định, NaN (không có giá) nằm cuối
+        self._price_order = np.argsort(self.price, kind="stable")
+        self._sorted_price = self.price[self._price_order]
+        self._priced_count = int(np.count_nonzero(~np.isnan(self.price)))
+        self._text_index: Optional[BM25Index] = None
+        self._positions: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def price_mask(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> np.ndarray:
+        """Mask các sản phẩm có giá trong [min_price, max_price] (tìm kiếm nhị phân trên index giá)"""
+        if min_price is None and max_price is None:
+            return np.ones(len(self.products), dtype=bool)
+        lo = 0 if min_price is None else int(np.searchsorted(self._sorted_price[:self._priced_count], min_price, side="left"))
+        hi = self._priced_count if max_price is None else int(np.searchsorted(self._sorted_price[:self._priced_count], max_price, side="right"))
+        mask = np.zeros(len(self.products), dtype=bool)
+        if hi > lo:
+            mask[self._price_order[lo:hi]] = True
+        return mask
+
+    def status_mask(self, status_filter: Optional[str]) -> np.ndarray:
+        if status_filter == "in_stock":
+            return (self.status != 0) & ~(self.stock <= 0)
+        if status_filter == "out_of_stock":
+            return (self.status != 1) | (self.stock <= 0)
+        if status_filter == "on_sale":
+            return self.final_price < self.base_price
+        return np.ones(len(self.products), dtype=bool)
+
+    def filter_mask(self, min_price: Optional[float] = None, max_price: Optional[float] = None, status_filter: Optional[str] = None) -> np.ndarray:
+        return self.price_mask(min_price, max_price) & self.status_mask(status_filter)
+
+    def filter(self, min_price: Optional[float] = None, max_price: Optional[float] = None, status_filter: Optional[str] = None) -> List[Dict]:
+        """Danh sách sản phẩm thoả điều kiện, giữ thứ tự ban đầu"""
+        mask = self.filter_mask(min_price, max_price, status_filter)
+        return [self.products[i] for i in np.flatnonzero(mask)]
+
+    @property
+    def text_index(self) -> BM25Index:
+        """Index BM25 trên tên (trọng số gấp đôi) và mô tả sản phẩm, dựng khi cần lần đầu"""
+        with self._lock:
+            if self._text_index is None:
+                documents = []
+                for p in self.products:
+                    name = str(p.get('productName') or p.get('name') or '')
+                    documents.append(f"{name} {name} {p.get('description') or ''}")
+                self._text_index = BM25Index(documents)
+            return self._text_index
+
+    def candidate_mask(self, min_price: Optional[float] = None, max_price: Optional[float] = None, status_filter: Optional[str] = None) -> np.ndarray:
+        """Mask theo bộ lọc giá / tình trạng; không sản phẩm nào thoả thì xét toàn bộ catalog"""
+        mask = self.filter_mask(min_price, max_price, status_filter)
+        if not mask.any():
+            mask = np.ones(len(self.products), dtype=bool)
+        return mask
+
+    def keyword_ranking(self, query: str, top_k: int = 5, mask: Optional[np.ndarray] = None) -> List[int]:
+        """Vị trí top-k sản phẩm theo BM25 (chỉ trong mask nếu có)"""
+        return [i for i, _ in self.text_index.search(query, top_k, mask)]
+
+    def search(self, query: str, top_k: int = 5, mask: Optional[np.ndarray] = None) -> List[Dict]:
+        """Top-k sản phẩm liên quan nhất tới câu truy vấn (chỉ trong mask nếu có)"""
+        return self.take(self.keyword_ranking(query, top_k, mask))
+
+    def position_of(self, product_id: Any) -> Optional[int]:
+        """Vị trí của sản phẩm theo id trong danh sách"""
+        if self._positions is None:
+            self._positions = {str(p.get('id')): i for i, p in enumerate(self.products) if p.get('id') is not None}
+        return self._positions.get(str(product_id))
+
+    def positions(self, product_ids: List[Any], mask: Optional[np.ndarray] = None) -> List[int]:
+        """Vị trí các sản phẩm theo thứ tự product_ids (ví dụ kết quả tìm kiếm vector), bỏ qua id
+        không có trong danh sách hoặc không thoả mask"""
+        result = []
+        for pid in product_ids:
+            pos = self.position_of(pid)
+            if pos is not None and (mask is None or mask[pos]):
+                result.append(pos)
+        return result
+
+    def take(self, positions: List[int]) -> List[Dict]:
+        return [self.products[i] for i in positions]
+
+    def head(self, mask: np.ndarray, top_k: int) -> List[Dict]:
+        """top_k sản phẩm đầu tiên trong mask theo thứ tự catalog"""
+        return self.take(np.flatnonzero(mask)[:top_k].tolist())
+
+
+class ProductStoreCache:
+    """Giữ ProductStore theo danh sách sản phẩm (theo identity của list trong catalog cache),
+    nên chỉ chuẩn hoá lại khi catalog được làm mới."""
+
+    def __init__(self, max_stores: int = 64):
+        self.max_stores = max_stores
+        self._stores: "OrderedDict[int, ProductStore]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def get(self, products: List[Dict]) -> ProductStore:
+        key = id(products)
+        with self._lock:
+            store = self._stores.get(key)
+            # store.products giữ tham chiếu tới list nên id không bị tái sử dụng khi còn trong cache
+            if store is not None and store.products is products:
+                self._stores.move_to_end(key)
+                return store
+            store = ProductStore(products)
+            self.builds += 1
+            self._stores[key] = store
+            while len(self._stores) > self.max_stores:
+                self._stores.popitem(last=False)
+            return store
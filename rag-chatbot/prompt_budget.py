@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt Budget
+Ước lượng token và xếp các phần context vào prompt theo độ ưu tiên trong một ngân sách token
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Tiếng Việt có dấu tốn token hơn tiếng Anh; ~3 ký tự / token là ước lượng an toàn cho Gemini
+DEFAULT_CHARS_PER_TOKEN = 3.0
+TRUNCATION_MARK = "…"
+
+
+def estimate_tokens(text: str, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> int:
+    return math.ceil(len(text or "") / chars_per_token)
+
+
+def truncate_text(text: str, max_chars: int) -> str:
+    """Cắt text tại ranh giới từ, thêm dấu '…' nếu bị cắt"""
+    text = text or ""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max(max_chars - len(TRUNCATION_MARK), 0)]
+    if " " in cut:
+        cut = cut[:cut.rfind(" ")]
+    return cut.rstrip(" ,.;:") + TRUNCATION_MARK
+
+
+def truncate_lines(text: str, max_chars: int) -> str:
+    """Giữ các dòng đầu (mục xếp hạng cao nhất trước) trong max_chars, dòng cuối có thể bị cắt"""
+    if len(text) <= max_chars:
+        return text
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        remaining = max_chars - used - len(TRUNCATION_MARK)
+        if len(line) + 1 > remaining:
+            if remaining > 20:
+                kept.append(truncate_text(line, remaining))
+            else:
+                kept.append(TRUNCATION_MARK)
+            break
+        kept.append(line)
+        used += len(line) + 1
+    return "\n".join(kept)
+
+
+class PromptSection(NamedTuple):
+    """Một phần context; priority nhỏ hơn được xếp trước, required luôn được giữ
+    (chỉ bị cắt khi dài hơn max_tokens)"""
+    name: str
+    text: str
+    priority: int
+    required: bool = False
+    max_tokens: Optional[int] = None
+
+
+class PackedPrompt(NamedTuple):
+    sections: Dict[str, str]
+    tokens: int
+    truncated: Tuple[str, ...]
+    dropped: Tuple[str, ...]
+
+
+def pack_sections(sections: List[PromptSection], budget_tokens: int, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN,
+                  min_section_tokens: int = 40) -> PackedPrompt:
+    """Xếp các phần theo priority vào ngân sách token. Phần required dài hơn max_tokens bị cắt trước;
+    phần không vừa bị cắt theo dòng nếu còn ít nhất min_section_tokens, ngược lại bị bỏ."""
+    packed: Dict[str, str] = {}
+    truncated: List[str] = []
+    dropped: List[str] = []
+    for section in sections:
+        if section.required:
+            text = section.text
+            if section.max_tokens is not None and estimate_tokens(text, chars_per_token) > section.max_tokens:
+                text = truncate_text(text, int(section.max_tokens * chars_per_token))
+                truncated.append(section.name)
+            packed[section.name] = text
+    used = sum(estimate_tokens(packed[s.name], chars_per_token) for s in sections if s.required)
+    for section in sorted(sections, key=lambda s: s.priority):
+        if section.required:
+            continue
+        tokens = estimate_tokens(section.text, chars_per_token)
+        remaining = budget_tokens - used
+        if tokens <= remaining:
+            packed[section.name] = section.text
+            used += tokens
+        elif remaining >= min_section_tokens:
+            text = truncate_lines(section.text, int(remaining * chars_per_token))
+            packed[section.name] = text
+            used += estimate_tokens(text, chars_per_token)
+            truncated.append(section.name)
+        else:
+            packed[section.name] = ""
+            dropped.append(section.name)
+    return PackedPrompt(packed, used, tuple(truncated), tuple(dropped))
+
+
+class PromptSizeStats:
+    """Kích thước prompt (token ước lượng) của các request gần nhất"""
+
+    def __init__(self, window: int = 1000):
+        self._tokens = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.truncated = 0
+        self.dropped_sections = 0
+
+    def record(self, packed: PackedPrompt):
+        with self._lock:
+            self._tokens.append(packed.tokens)
+            self.count += 1
+            self.truncated += bool(packed.truncated)
+            self.dropped_sections += len(packed.dropped)
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            tokens = np.array(self._tokens) if self._tokens else None
+            result = {"count": self.count, "truncated": self.truncated, "dropped_sections": self.dropped_sections}
+        if tokens is not None:
+            result.update({
+                "tokens_p50": float(np.percentile(tokens, 50)),
+                "tokens_p95": float(np.percentile(tokens, 95)),
+                "tokens_max": int(tokens.max()),
+            })
+        return result
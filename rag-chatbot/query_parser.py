@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Query Parser
+Phân tích tin nhắn một lần (grammar biên dịch sẵn) thành ParsedQuery bất biến cho mọi stage phía sau
+"""
+
+import re
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, Mapping, NamedTuple, Optional, Tuple
+
+from keyword_matcher import KeywordMatcher
+from text_utils import STOPWORDS, fold_accents, normalize_text, syllables
+
+# Thứ tự = độ ưu tiên khi tin nhắn khớp nhiều trạng thái
+STATUS_KEYWORDS = {
+    "in_stock": ["còn hàng", "in stock"],
+    "out_of_stock": ["hết hàng", "out of stock"],
+    "on_sale": ["đang giảm", "sale", "khuyến mãi"],
+}
+
+_UNITS = {
+    "k": 1_000, "nghìn": 1_000, "ngàn": 1_000, "nghin": 1_000, "ngan": 1_000,
+    "tr": 1_000_000, "triệu": 1_000_000, "trieu": 1_000_000, "củ": 1_000_000,
+    "đ": 1, "d": 1, "vnd": 1, "vnđ": 1, "đồng": 1, "dong": 1,
+}
+# Số có phân cách nghìn (150.000 / 1,000,000) hoặc thập phân (1.5 / 2,5), rồi đơn vị tuỳ chọn;
+# chữ số ngay sau đơn vị là phần lẻ kiểu nói tắt: 1tr5 = 1.5 triệu, 2k5 = 2.5 nghìn
+_AMOUNT = (
+    r"\b(\d+(?:[.,]\d+)*)\s*(?:("
+    + "|".join(sorted((re.escape(u) for u in _UNITS), key=len, reverse=True))
+    + r")(\d{1,3})?)?(?![\w])"
+)
+_RANGE_RE = re.compile(r"(?:từ\s*)?" + _AMOUNT + r"\s*(?:-|–|đến|tới|to)\s*" + _AMOUNT)
+_MAX_RE = re.compile(r"(?:dưới|nhỏ hơn|thấp hơn|ít hơn|rẻ hơn|không hơn|không quá|tối đa|under|below|<)\s*" + _AMOUNT)
+_MIN_RE = re.compile(r"(?:trên|lớn hơn|cao hơn|đắt hơn|tối thiểu|ít nhất|over|above|>|từ)\s*" + _AMOUNT)
+_THOUSANDS_RE = re.compile(r"^\d{1,3}([.,])\d{3}(?:\1\d{3})*$")
+_SEPARATOR_RE = re.compile(r"[.,]")
+# Số không có đơn vị chỉ được coi là giá khi đủ lớn ("iphone 15", "2 đến 5 ngày" không phải giá)
+_MIN_BARE_AMOUNT = 1_000
+# Năm ("mẫu 2023-2024", "từ 2020") không phải giá khi không có đơn vị
+_YEAR_RE = re.compile(r"^(?:19|20)\d{2}$")
+
+# Cụm ngay sau "shop" / "cửa hàng" ... cho tới động từ / từ hỏi / dấu câu
+_SHOP_MENTION_RE = re.compile(
+    r"(?:cửa hàng|gian hàng|shop|store)\s+(?!(?:nào|gì|này|kia|đó)(?:\s|$))(.+?)"
+    r"(?=\s+(?:bán|có|ở|là|không|ko|nào|gì|thế|như|cho|với|và|còn|đang|hiện)(?:\s|$)|\s*[?,.!;:]|$)"
+)
+
+
+def _parse_number(digits: str) -> Optional[float]:
+    if _THOUSANDS_RE.match(digits):
+        digits = _SEPARATOR_RE.sub("", digits)
+    else:
+        digits = digits.replace(",", ".")
+        if digits.count(".") > 1:
+            return None
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def _amount(digits: str, unit: Optional[str], fraction: Optional[str] = None, default_unit: Optional[str] = None) -> Optional[float]:
+    value = _parse_number(digits)
+    if value is None:
+        return None
+    if fraction:
+        # '1tr5': phần lẻ chỉ hợp lệ sau số nguyên và đơn vị nghìn / triệu
+        if not value.is_integer() or _UNITS[unit] < 1_000:
+            return None
+        value += float("0." + fraction)
+    unit = unit or default_unit
+    if unit:
+        return value * _UNITS[unit]
+    if _YEAR_RE.match(digits):
+        return None
+    return value if value >= _MIN_BARE_AMOUNT else None
+
+
+def parse_price_range(normalized: str) -> Tuple[Optional[float], Optional[float]]:
+    """(min, max) từ tin nhắn đã chuẩn hoá: 'dưới 100k', 'trên 2 triệu', 'từ 100k đến 300k',
+    '1-2tr', '1tr5 - 2tr', '150.000đ - 200.000đ', 'tối đa 500000 vnd', 'rẻ hơn 200k'"""
+    for match in _RANGE_RE.finditer(normalized):
+        d1, u1, f1, d2, u2, f2 = match.groups()
+        # '2-3 triệu', '100-200k': vế đầu dùng đơn vị của vế sau
+        v1, v2 = _amount(d1, u1, f1, u2), _amount(d2, u2, f2, u1)
+        if v1 and v2:
+            return min(v1, v2), max(v1, v2)
+    match = _MAX_RE.search(normalized)
+    if match:
+        value = _amount(*match.groups())
+        if value:
+            return None, value
+    match = _MIN_RE.search(normalized)
+    if match:
+        value = _amount(*match.groups())
+        if value:
+            return value, None
+    return None, None
+
+
+def shop_mentions(normalized: str) -> Tuple[str, ...]:
+    """Các cụm có thể là tên shop: 'shop ABC bán gì' -> ('abc',)"""
+    mentions = []
+    for match in _SHOP_MENTION_RE.finditer(normalized):
+        span = match.group(1).strip()
+        if span and not all(s in STOPWORDS for s in syllables(span)) and span not in mentions:
+            mentions.append(span)
+    return tuple(mentions)
+
+
+class ParsedQuery(NamedTuple):
+    """Kết quả phân tích một tin nhắn; các stage sau chỉ đọc, không phân tích lại"""
+    text: str
+    normalized: str
+    folded: str
+    price_min: Optional[float]
+    price_max: Optional[float]
+    status: Optional[str]
+    intents: Mapping[str, FrozenSet[str]]
+    shop_mentions: Tuple[str, ...]
+
+    @property
+    def price_filter(self) -> Dict[str, Optional[float]]:
+        return {"min": self.price_min, "max": self.price_max}
+
+    def has_intent(self, intent: str) -> bool:
+        return intent in self.intents
+
+    def keywords(self, intent: str) -> FrozenSet[str]:
+        return self.intents.get(intent, frozenset())
+
+
+class QueryParser:
+    """Dựng automaton từ khoá (intent + trạng thái) một lần; parse() chạy một lần mỗi tin nhắn"""
+
+    def __init__(self, intent_vocabularies: Dict[str, Iterable[str]]):
+        self.matcher = KeywordMatcher({**intent_vocabularies, **STATUS_KEYWORDS})
+
+    def parse(self, message: str) -> ParsedQuery:
+        normalized = normalize_text(message)
+        matches = self.matcher.scan(normalized)
+        status = next((s for s in STATUS_KEYWORDS if s in matches), None)
+        price_min, price_max = parse_price_range(normalized)
+        return ParsedQuery(
+            text=message,
+            normalized=normalized,
+            folded=fold_accents(normalized),
+            price_min=price_min,
+            price_max=price_max,
+            status=status,
+            intents=MappingProxyType({label: frozenset(keywords) for label, keywords in matches.items()}),
+            shop_mentions=shop_mentions(normalized) if "shop" in matches else (),
+        )
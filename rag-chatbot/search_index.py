@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Search Index
+Inverted index với điểm BM25 cho tìm kiếm từ khoá trên catalog
+"""
+
+import math
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from text_utils import tokenize
+
+
+class BM25Index:
+    """BM25 trên danh sách văn bản. Trọng số mỗi posting được tính sẵn lúc dựng index,
+    nên truy vấn chỉ còn tra term và cộng dồn bằng np.bincount."""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.size = len(documents)
+        self.k1 = k1
+        self.b = b
+        doc_terms = [Counter(tokenize(doc)) for doc in documents]
+        lengths = np.array([sum(c.values()) for c in doc_terms], dtype=np.float64)
+        avg_length = float(lengths.mean()) if self.size and lengths.sum() else 1.0
+        norm = k1 * (1 - b + b * lengths / avg_length)
+
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for doc_id, counts in enumerate(doc_terms):
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, items in postings.items():
+            ids = np.fromiter((i for i, _ in items), dtype=np.int64, count=len(items))
+            tfs = np.fromiter((tf for _, tf in items), dtype=np.float64, count=len(items))
+            idf = math.log(1 + (self.size - len(items) + 0.5) / (len(items) + 0.5))
+            self._postings[term] = (ids, idf * tfs * (k1 + 1) / (tfs + norm[ids]))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def scores(self, query: str) -> np.ndarray:
+        """Điểm BM25 của mọi văn bản cho câu truy vấn (0 nếu không khớp term nào)"""
+        hits = [self._postings[t] for t in set(tokenize(query)) if t in self._postings]
+        if not hits:
+            return np.zeros(self.size)
+        ids = np.concatenate([h[0] for h in hits])
+        weights = np.concatenate([h[1] for h in hits])
+        return np.bincount(ids, weights=weights, minlength=self.size)
+
+    def search(self, query: str, top_k: int = 5, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (doc_id, score) có điểm > 0, chỉ xét các văn bản trong mask nếu có"""
+        scores = self.scores(query)
+        if mask is not None:
+            scores = np.where(mask, scores, 0.0)
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        order = candidates[np.lexsort((candidates, -scores[candidates]))]
+        return [(int(i), float(scores[i])) for i in order]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], top_k: int, k: int = 60) -> List[Tuple[Hashable, float]]:
+    """Gộp nhiều bảng xếp hạng bằng RRF: score = sum 1 / (k + rank). Không cần chuẩn hoá điểm
+    giữa các index (BM25 và cosine khác thang đo); phần tử trùng được gộp, trả về tối đa top_k."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    # sorted ổn định: hoà điểm thì giữ thứ tự xuất hiện (bảng xếp hạng đầu tiên trước)
+    return sorted(scores.items(), key=lambda item: -item[1])[:top_k]
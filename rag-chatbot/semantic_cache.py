@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Semantic Cache
+Cache câu trả lời theo câu hỏi gần nghĩa: embedding cục bộ + tìm láng giềng gần nhất trong bộ nhớ,
+chỉ so với các câu hỏi cùng scope (intent + context trong prompt)
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+THRESHOLD_GRID = (0.75, 0.8, 0.85, 0.9, 0.95)
+
+
+class SemanticHit(NamedTuple):
+    answer: str
+    similarity: float
+    matched_question: str
+
+
+class SemanticAnswerCache:
+    """Ma trận embedding cố định `max_entries` dòng; slot được tái sử dụng theo LRU / TTL.
+
+    Tra cứu là tích vô hướng (vector đã chuẩn hoá L2 => cosine) giữa câu hỏi và các dòng cùng scope,
+    nên với vài nghìn entry là tìm kiếm chính xác và chỉ mất cỡ mili giây."""
+
+    def __init__(self, embedding_function, threshold: float = 0.85, max_entries: int = 5000, ttl_seconds: float = 600):
+        self.embedding_function = embedding_function
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._vectors: Optional[np.ndarray] = None
+        # slot -> (scope, question, answer, stored_at), thứ tự LRU
+        self._slots: "OrderedDict[int, tuple]" = OrderedDict()
+        self._scopes: Dict[str, set] = {}
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.metrics = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        # Similarity của láng giềng gần nhất mỗi lần tra cứu: ước lượng hit rate ở các ngưỡng khác
+        self._best_similarities = deque(maxlen=5000)
+        self._recent_hits = deque(maxlen=20)
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        """None nếu câu hỏi không có đặc trưng nào (toàn stopword): không thể so gần nghĩa"""
+        vector = np.asarray(self.embedding_function([question])[0], dtype=np.float32)
+        return vector if vector.any() else None
+
+    def _remove(self, slot: int):
+        scope = self._slots.pop(slot)[0]
+        members = self._scopes.get(scope)
+        if members is not None:
+            members.discard(slot)
+            if not members:
+                del self._scopes[scope]
+        self._free.append(slot)
+
+    def get(self, question: str, scope: str) -> Optional[SemanticHit]:
+        """Câu trả lời của câu hỏi gần nhất cùng scope nếu similarity đạt ngưỡng"""
+        vector = self._embed(question) if question else None
+        if vector is None:
+            return None
+        with self._lock:
+            self.metrics["lookups"] += 1
+            now = time.time()
+            for slot in [s for s in self._scopes.get(scope, ()) if now - self._slots[s][3] > self.ttl_seconds]:
+                self._remove(slot)
+                self.metrics["expired"] += 1
+            slots = list(self._scopes.get(scope, ()))
+            best_slot, best_similarity = None, 0.0
+            if slots:
+                similarities = self._vectors[slots] @ vector
+                top = int(np.argmax(similarities))
+                best_slot, best_similarity = slots[top], float(similarities[top])
+            self._best_similarities.append(best_similarity)
+            if best_slot is None or best_similarity < self.threshold:
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["hits"] += 1
+            self._slots.move_to_end(best_slot)
+            _, matched_question, answer, _ = self._slots[best_slot]
+            self._recent_hits.append({"question": question, "matched": matched_question, "similarity": round(best_similarity, 4)})
+            return SemanticHit(answer, best_similarity, matched_question)
+
+    def set(self, question: str, scope: str, answer: str):
+        vector = self._embed(question) if question and answer else None
+        if vector is None:
+            return
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if not self._free:
+                self._remove(next(iter(self._slots)))
+                self.metrics["evictions"] += 1
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._slots[slot] = (scope, question, answer, time.time())
+            self._scopes.setdefault(scope, set()).add(slot)
+            self.metrics["stores"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._slots.clear()
+            self._scopes.clear()
+            self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self.metrics)
+            best = np.array(self._best_similarities) if self._best_similarities else None
+            metrics["recent_hits"] = list(self._recent_hits)
+            metrics["entries"] = len(self._slots)
+            metrics["scopes"] = len(self._scopes)
+        metrics["threshold"] = self.threshold
+        metrics["hit_rate"] = round(metrics["hits"] / metrics["lookups"], 4) if metrics["lookups"] else None
+        if best is not None:
+            # Hit rate nếu dùng ngưỡng khác, tính trên các lần tra cứu gần đây
+            metrics["hit_rate_by_threshold"] = {str(t): round(float((best >= t).mean()), 4) for t in THRESHOLD_GRID}
+        return metrics
+
+
+def evaluate_thresholds(embedding_function, pairs: Iterable[Tuple[str, str, bool]], thresholds: Sequence[float] = THRESHOLD_GRID) -> List[Dict[str, Any]]:
+    """Đánh giá ngưỡng trên các cặp câu hỏi có nhãn (câu 1, câu 2, cùng ý hay không).
+
+    hit_rate: tỉ lệ cặp cùng ý được cache trả lời; false_hit_rate: tỉ lệ cặp khác ý bị trả lời nhầm."""
+    pairs = list(pairs)
+    if not pairs:
+        return []
+    first = np.asarray(embedding_function([p[0] for p in pairs]), dtype=np.float32)
+    second = np.asarray(embedding_function([p[1] for p in pairs]), dtype=np.float32)
+    similarities = (first * second).sum(axis=1)
+    same = np.array([bool(p[2]) for p in pairs])
+    report = []
+    for t in thresholds:
+        hits = similarities >= t
+        report.append({
+            "threshold": t,
+            "hit_rate": round(float(hits[same].mean()), 4) if same.any() else None,
+            "false_hit_rate": round(float(hits[~same].mean()), 4) if (~same).any() else None,
+        })
+    return report
+
+
+if __name__ == "__main__":
+    # python semantic_cache.py pairs.jsonl [model_path]
+    # mỗi dòng: {"q1": "...", "q2": "...", "same": true}
+    from text_utils import normalize_text
+    from vector_index import create_embedding_function
+
+    if len(sys.argv) < 2:
+        print("Usage: python semantic_cache.py pairs.jsonl [embedding_model_path]")
+        sys.exit(1)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    embedder = create_embedding_function(sys.argv[2] if len(sys.argv) > 2 else None)
+    labelled = [(normalize_text(r["q1"]), normalize_text(r["q2"]), r["same"]) for r in rows]
+    for row in evaluate_thresholds(embedder, labelled):
+        print(json.dumps(row, ensure_ascii=False))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Shop Index
+Index trigram trên tên shop đã bỏ dấu để tìm shop được nhắc tới trong tin nhắn (chịu lỗi chính tả)
+"""
+
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from text_utils import STOPWORDS, syllables
+
+
+def shop_name(shop: Dict) -> str:
+    return str(shop.get('shopName') or shop.get('name') or '').strip()
+
+
+def _trigrams(words: List[str]) -> Counter:
+    """Multiset trigram ký tự theo từng âm tiết (có đệm '#'), nên không phụ thuộc thứ tự từ.
+    Giữ số lần lặp: 'An An' có gấp đôi trigram của 'an'."""
+    grams = Counter()
+    for word in words:
+        padded = f"#{word}#"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class ShopNameIndex:
+    """Dựng một lần cho mỗi danh sách shop.
+
+    Khớp chính xác: tra các cụm âm tiết liên tiếp của tin nhắn trong dict tên shop.
+    Khớp gần đúng: với mỗi cụm âm tiết ứng viên của tin nhắn, đếm trigram chung qua inverted
+    index (chỉ chạm tới shop có trigram chung) và chấm điểm |A∩B| / max(|A|, |B|) trên multiset.
+    Mọi âm tiết của tên shop phải có trigram chung với cụm, nên một âm tiết chung không đủ để khớp
+    tên nhiều âm tiết ('hoa' / 'Hoa Tươi', 'nguyen có' / 'Nguyễn Ba')."""
+
+    def __init__(self, shops: List[Dict], min_score: float = 0.6, max_span_words: int = 6):
+        self.shops = shops
+        self.min_score = min_score
+        self._exact: Dict[str, int] = {}
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        sizes = []
+        # Trigram của từng âm tiết trong tên, để kiểm tra cụm có phủ đủ các âm tiết không
+        self._word_grams: List[List[Set[str]]] = []
+        max_words = 0
+        for i, shop in enumerate(shops):
+            words = syllables(shop_name(shop))
+            if words:
+                self._exact.setdefault(" ".join(words), i)
+                max_words = max(max_words, len(words))
+            grams = _trigrams(words)
+            sizes.append(sum(grams.values()))
+            self._word_grams.append([set(_trigrams([w])) for w in words])
+            for gram, count in grams.items():
+                postings[gram].append((i, count))
+        # trigram -> (shop ids, số lần xuất hiện trong tên)
+        self._postings = {
+            gram: (np.array([i for i, _ in items], dtype=np.int64), np.array([c for _, c in items], dtype=np.float64))
+            for gram, items in postings.items()
+        }
+        self._sizes = np.array(sizes, dtype=np.float64)
+        # Cụm dài hơn tên dài nhất một âm tiết để bắt lỗi tách từ ("abcshop" / "abc shop")
+        self.max_span_words = min(max_words + 1, max_span_words)
+
+    def __len__(self) -> int:
+        return len(self.shops)
+
+    def _spans(self, words: List[str]):
+        for length in range(1, self.max_span_words + 1):
+            for start in range(len(words) - length + 1):
+                yield words[start:start + length]
+
+    def search(self, message: str, limit: int = 5) -> List[Tuple[Dict, float]]:
+        """Các shop đạt min_score và điểm (1.0 nếu khớp chính xác), điểm cao nhất trước"""
+        words = syllables(message)
+        best: Dict[int, float] = {}
+        seen: Set[tuple] = set()
+        for span in self._spans(words):
+            exact = self._exact.get(" ".join(span))
+            if exact is not None:
+                best[exact] = 1.0
+            if all(w in STOPWORDS for w in span):
+                continue
+            grams = _trigrams(span)
+            key = tuple(sorted(grams.items()))
+            if not grams or key in seen:
+                continue
+            seen.add(key)
+            hits = [(self._postings[g], n) for g, n in grams.items() if g in self._postings]
+            if not hits:
+                continue
+            ids, inverse = np.unique(np.concatenate([p[0] for p, _ in hits]), return_inverse=True)
+            overlap = np.concatenate([np.minimum(p[1], n) for p, n in hits])
+            shared = np.bincount(inverse, weights=overlap, minlength=len(ids))
+            scores = shared / np.maximum(sum(grams.values()), self._sizes[ids])
+            # Ứng viên đạt ngưỡng có điểm cao nhất và phủ đủ mọi âm tiết của tên
+            passing = np.flatnonzero(scores >= self.min_score)
+            for top in passing[np.argsort(-scores[passing])]:
+                shop_id, score = int(ids[top]), float(scores[top])
+                if all(word_grams & grams.keys() for word_grams in self._word_grams[shop_id]):
+                    if score > best.get(shop_id, 0.0):
+                        best[shop_id] = score
+                    break
+        ranked = sorted(best.items(), key=lambda item: -item[1])[:limit]
+        return [(self.shops[i], score) for i, score in ranked]
+
+    def match(self, message: str) -> Optional[Dict]:
+        """Shop khớp tốt nhất nếu điểm đạt min_score"""
+        candidates = self.search(message, limit=1)
+        if candidates and candidates[0][1] >= self.min_score:
+            return candidates[0][0]
+        return None
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test cache câu trả lời theo fingerprint câu hỏi + context (answer_cache)
+"""
+
+from answer_cache import AnswerCache, answer_fingerprint, normalize_question
+
+CONTEXT = {"products": "1. Áo thun - Giá: 150000", "shops": "TechZone"}
+
+
+def test_same_question_and_context_hits():
+    cache = AnswerCache()
+    question = normalize_question("có những cửa hàng nào?")
+    assert question == normalize_question("có  những cửa hàng nào")
+    fingerprint = answer_fingerprint(question, CONTEXT)
+    assert cache.get(fingerprint) is None
+    cache.set(fingerprint, "Có TechZone", 850.0)
+    assert cache.get(answer_fingerprint(question, dict(reversed(list(CONTEXT.items()))))) == "Có TechZone"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_ms"]) == (1, 1, 850.0)
+
+
+def test_context_change_misses():
+    cache = AnswerCache()
+    question = normalize_question("áo thun giá bao nhiêu")
+    cache.set(answer_fingerprint(question, CONTEXT), "150.000đ", 500.0)
+    refreshed = {**CONTEXT, "products": "1. Áo thun - Giá: 120000"}
+    assert cache.get(answer_fingerprint(question, refreshed)) is None
+    assert cache.get(answer_fingerprint("áo thun giá rẻ", CONTEXT)) is None
+
+
+def test_empty_answer_not_stored_and_lru():
+    cache = AnswerCache(max_entries=2)
+    cache.set("a", "", 1.0)
+    assert cache.stats()["stores"] == 0
+    for fingerprint in ("a", "b", "c"):
+        cache.set(fingerprint, fingerprint.upper(), 1.0)
+    assert cache.get("a") is None and cache.get("c") == "C"
+    assert cache.stats()["evictions"]["lru"] == 1
+
+
+if __name__ == "__main__":
+    test_same_question_and_context_hits()
+    test_context_change_misses()
+    test_empty_answer_not_stored_and_lru()
+    print("✅ Answer cache tests passed!")
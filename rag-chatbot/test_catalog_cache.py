@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test bộ nhớ đệm catalog (CatalogCache): LRU, dung lượng, TTL theo namespace, stale
+"""
+
+from catalog_cache import CatalogCache, approx_size
+
+
+def test_lru_eviction():
+    cache = CatalogCache(max_entries=2)
+    cache.set("a|1", [1])
+    cache.set("a|2", [2])
+    cache.get("a|1")
+    cache.set("a|3", [3])
+    assert "a|2" not in cache and cache.get("a|1") == [1] and cache.get("a|3") == [3]
+    assert cache.stats()["evictions"]["lru"] == 1
+
+
+def test_size_limit_and_known_size():
+    cache = CatalogCache(max_bytes=100)
+    cache.set("a|big", "x" * 200)
+    assert "a|big" not in cache and cache.stats()["rejected"] == 1
+    # size truyền vào (độ dài body HTTP) được dùng thay cho approx_size
+    cache.set("a|1", [1], size=60)
+    cache.set("a|2", [2], size=60)
+    assert "a|1" not in cache and cache.stats()["bytes"] == 60
+    cache.set("a|3", [3])
+    assert cache.stats()["bytes"] == 60 + approx_size([3])
+
+
+def test_oversize_payload_keeps_last_good_entry():
+    cache = CatalogCache(max_bytes=100)
+    cache.set("a|1", [1], validators={"etag": '"v1"'})
+    cache.set("a|1", "x" * 200)
+    assert cache.get("a|1") == [1] and cache.validators("a|1") == {"etag": '"v1"'}
+    assert cache.stats()["rejected"] == 1 and cache.stats()["bytes"] == approx_size([1])
+
+
+def test_namespace_ttl_and_stale_entries():
+    cache = CatalogCache(default_ttl=60, namespace_ttls={"flash": 10}, retention_seconds=100)
+    cache.set("flash|now", ["sale"], age=20)
+    cache.set("products|all", ["p"], age=20)
+    assert cache.get("flash|now") is None
+    entry = cache.get_entry("flash|now")
+    assert entry.data == ["sale"] and entry.ttl == 10 and entry.age > entry.ttl
+    assert cache.get("products|all") == ["p"]
+    # Quá TTL + retention thì bị loại khi đọc tới
+    cache.set("flash|old", ["old"], age=200)
+    assert cache.get_entry("flash|old") is None and "flash|old" not in cache
+
+
+def test_touch_keeps_validators():
+    cache = CatalogCache(default_ttl=60)
+    cache.set("a|1", [1], validators={"etag": '"v1"'}, age=120)
+    assert cache.touch("a|1") == [1]
+    assert cache.get("a|1") == [1] and cache.validators("a|1") == {"etag": '"v1"'}
+
+
+if __name__ == "__main__":
+    test_lru_eviction()
+    test_size_limit_and_known_size()
+    test_oversize_payload_keeps_last_good_entry()
+    test_namespace_ttl_and_stale_entries()
+    test_touch_keeps_validators()
+    print("✅ Catalog cache tests passed!")
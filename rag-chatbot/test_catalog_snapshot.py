@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test lưu / nạp snapshot catalog (catalog_snapshot)
+"""
+
+import os
+import tempfile
+
+from catalog_cache import CatalogCache
+from catalog_snapshot import load_snapshot, save_snapshot
+
+
+def test_round_trip_keeps_entries_and_sizes():
+    cache = CatalogCache(default_ttl=60)
+    cache.set("get_products|", [{"id": 1, "productName": "Áo thun", "price": 150000.0}], validators={"etag": '"v1"'}, size=4096)
+    cache.set("get_shops|pageNumber=1", [{"id": "s1", "shopName": "TechZone"}])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog_snapshot.bin")
+        written = save_snapshot(path, cache.export())
+        assert written == os.path.getsize(path)
+        # Không để lại file tạm
+        assert os.listdir(directory) == ["catalog_snapshot.bin"]
+        snapshot = load_snapshot(path)
+
+    restored = CatalogCache(default_ttl=60)
+    for key, data, validators, age, size in snapshot["entries"]:
+        restored.set(key, data, validators=validators, age=age, size=size)
+    assert restored.get("get_products|") == [{"id": 1, "productName": "Áo thun", "price": 150000.0}]
+    assert restored.validators("get_products|") == {"etag": '"v1"'}
+    assert restored.stats()["bytes"] == cache.stats()["bytes"]
+
+
+def test_missing_or_corrupt_snapshot():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog_snapshot.bin")
+        assert load_snapshot(path) is None
+        with open(path, "wb") as f:
+            f.write(b"not a snapshot file")
+        assert load_snapshot(path) is None
+
+
+if __name__ == "__main__":
+    test_round_trip_keeps_entries_and_sizes()
+    test_missing_or_corrupt_snapshot()
+    print("✅ Catalog snapshot tests passed!")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test pipeline xử lý tin nhắn (ChatPipeline): kiểm tra thứ tự stage, dừng sớm, stop_before
+"""
+
+import asyncio
+
+from chat_pipeline import DEFAULT_STAGE_ORDER, ChatPipeline, ChatState, PipelineStage, parse_stage_order
+
+DEPENDENCIES = {
+    "scope_guard": ("normalize",),
+    "cache": ("normalize", "prompt"),
+    "generate": ("prompt",),
+    "persist": ("generate",),
+}
+
+
+def make_stages(ran, answer_at=None):
+    def stage(name):
+        async def run(state):
+            ran.append(name)
+            if name == answer_at:
+                state.respond("cached answer", name)
+            elif name == "generate":
+                state.answer = "generated"
+        return PipelineStage(name, run, DEPENDENCIES.get(name, ()), always=name == "persist")
+    return [stage(name) for name in DEFAULT_STAGE_ORDER]
+
+
+def run(pipeline, **kwargs):
+    return asyncio.run(pipeline.run(ChatState("áo thun giá bao nhiêu"), **kwargs))
+
+
+def test_parse_stage_order():
+    assert parse_stage_order(" normalize, generate ,") == ("normalize", "generate")
+    assert parse_stage_order("") == DEFAULT_STAGE_ORDER
+
+
+def test_invalid_order_falls_back_to_default():
+    for order in (
+        ("normalize", "unknown", "prompt", "generate"),
+        ("normalize", "normalize", "prompt", "generate"),
+        ("normalize", "prompt"),
+        ("normalize", "generate", "prompt"),
+    ):
+        assert ChatPipeline(make_stages([]), order).order == DEFAULT_STAGE_ORDER
+    order = ("normalize", "prompt", "generate")
+    assert ChatPipeline(make_stages([]), order).order == order
+
+
+def test_short_circuit_still_runs_always_stages():
+    ran = []
+    pipeline = ChatPipeline(make_stages(ran, answer_at="cache"))
+    state = run(pipeline)
+    assert ran == ["normalize", "scope_guard", "intent", "retrieval", "prompt", "cache", "persist"]
+    assert state.answer == "cached answer" and state.answered_by == "cache"
+    assert pipeline.stats()["short_circuits"] == {"cache": 1}
+    assert set(state.timings) == set(ran)
+
+
+def test_stop_before():
+    ran = []
+    state = run(ChatPipeline(make_stages(ran)), stop_before="generate")
+    assert ran == ["normalize", "scope_guard", "intent", "retrieval", "prompt", "cache"]
+    assert state.answer is None and not state.done
+
+
+if __name__ == "__main__":
+    test_parse_stage_order()
+    test_invalid_order_falls_back_to_default()
+    test_short_circuit_still_runs_always_stages()
+    test_stop_before()
+    print("✅ Chat pipeline tests passed!")
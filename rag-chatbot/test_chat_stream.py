@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test endpoint /chat/stream (SSE) với Gemini giả lập và backend giả lập
+"""
+
+import json
+import os
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ["BACKEND_API_URL"] = "http://backend"
+os.environ["CATALOG_SNAPSHOT_PATH"] = ""
+
+import httpx
+from fastapi.testclient import TestClient
+
+import main
+
+PRODUCTS = [{"id": 1, "productName": "Giày thể thao", "price": 900000, "description": "Giày chạy bộ"}]
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        chunks = ["Giày thể thao ", "giá ", "900.000đ"]
+        return [Chunk(c) for c in chunks] if stream else Chunk("".join(chunks))
+
+
+async def backend(request):
+    if request.url.path == "/api/products":
+        return httpx.Response(200, json=PRODUCTS)
+    return httpx.Response(200, json=[])
+
+
+def events(body):
+    """[(event, data)] từ nội dung SSE"""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def make_client():
+    main.model = StubModel()
+    main.chatbot_service.answer_cache.clear()
+    main.chatbot_service.api_service._client = httpx.AsyncClient(base_url="http://backend", transport=httpx.MockTransport(backend))
+    return TestClient(main.app)
+
+
+def test_stream_event_order():
+    client = make_client()
+    response = client.post("/chat/stream", json={"message": "giày thể thao giá bao nhiêu"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    parsed = events(response.text)
+    assert [event for event, _ in parsed] == ["start", "delta", "delta", "delta", "done"]
+    assert "".join(data["text"] for event, data in parsed if event == "delta") == "Giày thể thao giá 900.000đ"
+    assert parsed[-1][1]["status"] == "success" and parsed[-1][1]["user_id"] == parsed[0][1]["user_id"]
+
+
+def test_cached_answer_sent_as_single_delta():
+    client = make_client()
+    message = "giày thể thao chạy bộ giá bao nhiêu"
+    first = events(client.post("/chat/stream", json={"message": message}).text)
+    second = events(client.post("/chat/stream", json={"message": message}).text)
+    assert main.model.calls == 1
+    assert [event for event, _ in second] == ["start", "delta", "done"]
+    assert second[1][1]["text"] == "".join(data["text"] for event, data in first if event == "delta")
+
+
+if __name__ == "__main__":
+    test_stream_event_order()
+    test_cached_answer_sent_as_single_delta()
+    print("✅ Chat stream tests passed!")
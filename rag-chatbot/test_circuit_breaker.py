@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test ngắt mạch theo endpoint backend (CircuitBreaker)
+"""
+
+import time
+
+from circuit_breaker import CircuitBreaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("products", failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request() and breaker.stats()["rejected"] == 1
+
+
+def test_half_open_allows_one_probe_then_closes():
+    breaker = CircuitBreaker("shops", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success(0.01)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow_request()
+    assert breaker.stats()["transitions"] == {"closed->open": 1, "open->half_open": 1, "half_open->closed": 1}
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("shops", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow_request()
+
+
+def test_slow_call_counts_as_failure():
+    breaker = CircuitBreaker("flash_sales", failure_threshold=2, reset_timeout=60, slow_call_threshold=0.5)
+    breaker.record_success(0.1)
+    breaker.record_success(1.0)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success(2.0)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()["slow_calls"] == 2 and breaker.stats()["successes"] == 1
+
+
+if __name__ == "__main__":
+    test_opens_after_consecutive_failures()
+    test_half_open_allows_one_probe_then_closes()
+    test_failed_probe_reopens()
+    test_slow_call_counts_as_failure()
+    print("✅ Circuit breaker tests passed!")
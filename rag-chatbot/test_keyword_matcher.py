@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test khớp từ khoá nhiều nhãn một lần duyệt (KeywordMatcher)
+"""
+
+import unicodedata
+
+from keyword_matcher import KeywordMatcher
+
+MATCHER = KeywordMatcher({
+    "product": ["sản phẩm", "giá", "mua"],
+    "shop": ["shop", "cửa hàng"],
+    "policy": ["đổi trả", "mua hàng"],
+})
+
+
+def test_matches_like_substring_search():
+    assert MATCHER.scan("Chính sách ĐỔI TRẢ khi mua hàng") == {
+        "product": {"mua"},
+        "policy": {"đổi trả", "mua hàng"},
+    }
+    assert MATCHER.scan("shopee") == {"shop": {"shop"}}
+    assert MATCHER.scan("xin chào") == {}
+
+
+def test_overlapping_keywords_and_labels():
+    matcher = KeywordMatcher({"a": ["he", "hers"], "b": ["she", "his"]})
+    assert matcher.scan("ushers") == {"a": {"he", "hers"}, "b": {"she"}}
+
+
+def test_unicode_forms_match():
+    decomposed = unicodedata.normalize("NFD", "Cửa hàng này bán giá rẻ")
+    assert MATCHER.scan(decomposed) == {"shop": {"cửa hàng"}, "product": {"giá"}}
+
+
+if __name__ == "__main__":
+    test_matches_like_substring_search()
+    test_overlapping_keywords_and_labels()
+    test_unicode_forms_match()
+    print("✅ Keyword matcher tests passed!")
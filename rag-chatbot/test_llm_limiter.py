@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test admission controller cho lời gọi Gemini (llm_limiter)
+"""
+
+import asyncio
+import time
+
+from llm_limiter import AdmissionController, LLMOverloadedError, is_rate_limit_error, priority_class
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+def test_priority_class():
+    assert priority_class(True) == "authenticated"
+    assert priority_class(False) == "anonymous"
+
+
+def test_authenticated_served_first():
+    async def run():
+        limiter = AdmissionController(max_concurrency=1)
+        await limiter.acquire("anonymous")
+        order = []
+
+        async def wait(priority):
+            await limiter.acquire(priority)
+            order.append(priority)
+            limiter.release(duration=0.01)
+
+        tasks = [asyncio.ensure_future(wait("anonymous")), asyncio.ensure_future(wait("authenticated"))]
+        await asyncio.sleep(0)
+        limiter.release(duration=0.01)
+        await asyncio.gather(*tasks)
+        return order, limiter.in_flight
+
+    assert asyncio.run(run()) == (["authenticated", "anonymous"], 0)
+
+
+def test_queue_limit_per_class():
+    async def run():
+        limiter = AdmissionController(max_concurrency=1, queue_limits={"anonymous": 1})
+        await limiter.acquire("authenticated")
+        waiting = asyncio.ensure_future(limiter.acquire("anonymous"))
+        await asyncio.sleep(0)
+        try:
+            await limiter.acquire("anonymous")
+        except LLMOverloadedError as e:
+            reason = e.reason
+        waiting.cancel()
+        return reason, limiter.stats()["classes"]["anonymous"]["rejected"]
+
+    assert asyncio.run(run()) == ("queue_full", 1)
+
+
+def test_waiter_dropped_at_deadline():
+    async def run():
+        limiter = AdmissionController(max_concurrency=1)
+        await limiter.acquire("authenticated")
+        try:
+            await limiter.acquire("authenticated", deadline=time.monotonic() + 0.05)
+        except LLMOverloadedError as e:
+            return e.reason, limiter.queue_depth
+
+    assert asyncio.run(run()) == ("deadline", 0)
+
+
+def test_backoff_on_rate_limit_and_recovery():
+    async def run():
+        limiter = AdmissionController(max_concurrency=8, min_concurrency=2, backoff_factor=0.5, backoff_cooldown=60)
+        limits = []
+        for _ in range(2):
+            await limiter.acquire()
+            limiter.release(error=RateLimited("quota"))
+            limits.append(limiter.limit)
+        for _ in range(5):
+            await limiter.acquire()
+            limiter.release(duration=0.01)
+        limits.append(limiter.limit)
+        return limits, limiter.stats()["backoffs"]
+
+    # Hai lần 429 trong cùng cooldown chỉ giảm một lần; các lời gọi thành công tăng lại dần
+    assert asyncio.run(run()) == ([4, 4, 5], 1)
+
+
+def test_is_rate_limit_error():
+    assert is_rate_limit_error(RateLimited())
+    assert is_rate_limit_error(Exception("429 Resource has been exhausted (e.g. check quota)."))
+    assert not is_rate_limit_error(ValueError("invalid prompt"))
+
+
+if __name__ == "__main__":
+    test_priority_class()
+    test_authenticated_served_first()
+    test_queue_limit_per_class()
+    test_waiter_dropped_at_deadline()
+    test_backoff_on_rate_limit_and_recovery()
+    test_is_rate_limit_error()
+    print("✅ LLM limiter tests passed!")
@@ -4,7 +4,15 @@
 Test script to verify policies integration
 """
 
-from policies import search_policy, get_purchase_policy, get_sales_policy
+from policies import (
+    POLICY_SECTIONS,
+    find_policy_sections,
+    format_policy_sections,
+    search_policy,
+    search_policy_sections,
+    get_purchase_policy,
+    get_sales_policy,
+)
 
 def test_policies():
     print("=== Testing Policy System ===\n")
@@ -23,5 +31,31 @@ def test_policies():
     
     print("✅ Policy integration test completed successfully!")
 
+def test_policy_sections():
+    assert len(POLICY_SECTIONS) > 3
+    assert all(section.title and section.text for section in POLICY_SECTIONS)
+    sections = find_policy_sections("chính sách đổi trả hoàn tiền")
+    assert sections and "ĐỔI TRẢ" in sections[0].heading
+    assert len(format_policy_sections(sections)) <= 1200
+    assert search_policy_sections("mở shop bán hàng") != search_policy("mở shop bán hàng")
+
+
+def test_policy_sections_within_max_chars():
+    for max_chars in (80, 200, 600):
+        sections = find_policy_sections("đổi trả hoàn tiền", max_sections=3, max_chars=max_chars)
+        # Mục đầu tiên luôn được giữ, kể cả khi phải cắt bớt
+        assert sections and "ĐỔI TRẢ" in sections[0].heading
+        assert len(format_policy_sections(sections)) <= max_chars
+
+
+def test_unmatched_query_returns_outline():
+    assert find_policy_sections("xyzzy") == []
+    outline = search_policy_sections("xyzzy")
+    assert outline.startswith("CÁC MỤC CHÍNH SÁCH STREAMCART")
+    assert "CHÍNH SÁCH MUA HÀNG" in outline
+
 if __name__ == "__main__":
     test_policies()
+    test_policy_sections()
+    test_policy_sections_within_max_chars()
+    test_unmatched_query_returns_outline()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test lọc sản phẩm theo giá / tình trạng trên dữ liệu dạng cột (ProductStore)
+"""
+
+from product_store import ProductStore, ProductStoreCache, parse_price
+
+PRODUCTS = [
+    {"id": 1, "productName": "Áo thun", "basePrice": 200000, "finalPrice": 150000, "stockQuantity": 10},
+    {"id": 2, "productName": "Quần jean", "price": "350.000", "status": "active"},
+    {"id": 3, "productName": "Giày thể thao", "basePrice": 900000, "stockQuantity": 0},
+    {"id": 4, "productName": "Mũ lưỡi trai", "status": "inactive", "price": 80000},
+    {"id": 5, "productName": "Túi xách"},
+]
+
+
+def ids(products):
+    return [p["id"] for p in products]
+
+
+def test_parse_price():
+    assert parse_price(150000) == 150000.0
+    assert parse_price("1.500.000") == 1_500_000.0
+    assert parse_price("150,000") == 150_000.0
+    assert parse_price("liên hệ") is None
+
+
+def test_price_filter():
+    store = ProductStore(PRODUCTS)
+    assert ids(store.filter(max_price=200_000)) == [1, 4]
+    assert ids(store.filter(min_price=150_000, max_price=350_000)) == [1, 2]
+    assert ids(store.filter(min_price=1_000_000)) == []
+    # Không có bộ lọc: giữ mọi sản phẩm, kể cả không có giá
+    assert ids(store.filter()) == [1, 2, 3, 4, 5]
+
+
+def test_status_filter():
+    store = ProductStore(PRODUCTS)
+    assert ids(store.filter(status_filter="in_stock")) == [1, 2, 5]
+    # Như bộ lọc cũ: chỉ loại sản phẩm ghi rõ đang bán, sản phẩm không rõ trạng thái vẫn được giữ
+    assert ids(store.filter(status_filter="out_of_stock")) == [1, 3, 4, 5]
+    assert ids(store.filter(status_filter="on_sale")) == [1]
+    assert ids(store.filter(max_price=300_000, status_filter="in_stock")) == [1]
+
+
+def test_candidate_mask_falls_back_to_catalog():
+    store = ProductStore(PRODUCTS)
+    assert store.candidate_mask(min_price=10_000_000).all()
+    assert ids(store.head(store.candidate_mask(max_price=200_000), 1)) == [1]
+
+
+def test_store_cache_rebuilds_on_new_list():
+    cache = ProductStoreCache()
+    products = list(PRODUCTS)
+    assert cache.get(products) is cache.get(products) and cache.builds == 1
+    cache.get(list(PRODUCTS))
+    assert cache.builds == 2
+
+
+if __name__ == "__main__":
+    test_parse_price()
+    test_price_filter()
+    test_status_filter()
+    test_candidate_mask_falls_back_to_catalog()
+    test_store_cache_rebuilds_on_new_list()
+    print("✅ Product store tests passed!")
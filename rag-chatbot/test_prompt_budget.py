@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test xếp context vào ngân sách token (prompt_budget)
+"""
+
+from prompt_budget import TRUNCATION_MARK, PromptSection, estimate_tokens, pack_sections, truncate_lines, truncate_text
+
+
+def test_truncate_text_and_lines():
+    assert truncate_text("áo thun", 20) == "áo thun"
+    cut = truncate_text("áo thun nam cổ tròn màu đen", 15)
+    assert len(cut) <= 15 and cut.endswith(TRUNCATION_MARK) and cut.startswith("áo thun")
+    lines = "\n".join(f"{i}. Sản phẩm số {i} giá 100000" for i in range(1, 20))
+    kept = truncate_lines(lines, 120)
+    assert len(kept) <= 120 and kept.startswith("1. Sản phẩm số 1")
+
+
+def test_sections_packed_by_priority():
+    sections = [
+        PromptSection("question", "áo thun giá bao nhiêu", 0, required=True),
+        PromptSection("shops", "s" * 300, 2),
+        PromptSection("products", "p" * 300, 1),
+    ]
+    packed = pack_sections(sections, budget_tokens=140, chars_per_token=3)
+    assert packed.sections["products"] == "p" * 300
+    assert packed.sections["shops"] == "" and packed.dropped == ("shops",)
+    assert packed.tokens <= 140
+
+
+def test_section_truncated_to_remaining_budget():
+    products = "\n".join(f"{i}. Sản phẩm {i}" for i in range(100))
+    packed = pack_sections([PromptSection("products", products, 1)], budget_tokens=100, chars_per_token=3)
+    assert packed.truncated == ("products",)
+    assert packed.sections["products"].startswith("0. Sản phẩm 0")
+    assert packed.tokens <= 100
+
+
+def test_long_required_question_capped():
+    question = "áo " * 10_000
+    sections = [
+        PromptSection("question", question, 0, required=True, max_tokens=100),
+        PromptSection("products", "p" * 600, 1),
+    ]
+    packed = pack_sections(sections, budget_tokens=500, chars_per_token=3)
+    assert "question" in packed.truncated
+    assert estimate_tokens(packed.sections["question"], 3) <= 100
+    # Context vẫn còn chỗ và tổng không vượt ngân sách
+    assert packed.sections["products"] == "p" * 600
+    assert packed.tokens <= 500
+
+
+if __name__ == "__main__":
+    test_truncate_text_and_lines()
+    test_sections_packed_by_priority()
+    test_section_truncated_to_remaining_budget()
+    test_long_required_question_capped()
+    print("✅ Prompt budget tests passed!")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test phân tích giá và tin nhắn (query_parser)
+"""
+
+from query_parser import QueryParser, parse_price_range
+from text_utils import normalize_text
+
+
+def price(message):
+    return parse_price_range(normalize_text(message))
+
+
+def test_price_units():
+    assert price("điện thoại dưới 2 triệu") == (None, 2_000_000)
+    assert price("áo trên 150.000đ") == (150_000, None)
+    assert price("tai nghe 1-2tr") == (1_000_000, 2_000_000)
+    assert price("từ 100k đến 300k") == (100_000, 300_000)
+    assert price("150.000đ - 200.000đ") == (150_000, 200_000)
+    assert price("tối đa 500000 vnd") == (None, 500_000)
+    assert price("dưới 1,5 củ") == (None, 1_500_000)
+
+
+def test_comparison_phrases():
+    assert price("áo rẻ hơn 200k") == (None, 200_000)
+    assert price("giày rẻ hơn 1 triệu") == (None, 1_000_000)
+    assert price("không hơn 300k") == (None, 300_000)
+    assert price("túi đắt hơn 500k") == (500_000, None)
+    assert price("lớn hơn 2 triệu") == (2_000_000, None)
+
+
+def test_shorthand_fraction():
+    assert price("từ 1tr5 đến 2tr") == (1_500_000, 2_000_000)
+    assert price("2tr-2tr500") == (2_000_000, 2_500_000)
+    assert price("dưới 1tr5") == (None, 1_500_000)
+    assert price("trên 2k5") == (2_500, None)
+
+
+def test_numbers_that_are_not_prices():
+    assert price("giao hàng mất 2 đến 5 ngày") == (None, None)
+    assert price("bàn dài trên 2m") == (None, None)
+    assert price("áo mẫu 2023-2024") == (None, None)
+    assert price("điện thoại từ 2020") == (None, None)
+    assert price("iphone 15 còn hàng không") == (None, None)
+
+
+def test_parse_once():
+    parser = QueryParser({"product": ["sản phẩm", "giá"], "shop": ["shop", "cửa hàng"]})
+    query = parser.parse("Shop ABC có sản phẩm nào còn hàng dưới 200K?")
+    assert query.price_filter == {"min": None, "max": 200_000}
+    assert query.status == "in_stock"
+    assert query.has_intent("product") and query.keywords("product") == {"sản phẩm"}
+    assert query.shop_mentions == ("abc",)
+
+
+if __name__ == "__main__":
+    test_price_units()
+    test_comparison_phrases()
+    test_shorthand_fraction()
+    test_numbers_that_are_not_prices()
+    test_parse_once()
+    print("✅ Query parser tests passed!")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test tìm kiếm từ khoá BM25 và gộp bảng xếp hạng RRF (search_index)
+"""
+
+import numpy as np
+
+from search_index import BM25Index, reciprocal_rank_fusion
+
+DOCUMENTS = [
+    "áo thun nam cổ tròn",
+    "áo khoác nam chống nắng",
+    "giày thể thao nữ",
+    "áo thun áo thun trẻ em",
+]
+
+
+def test_bm25_ranking():
+    index = BM25Index(DOCUMENTS)
+    results = index.search("áo thun", top_k=5)
+    assert [doc_id for doc_id, _ in results][:2] == [3, 0]
+    assert all(score > 0 for _, score in results)
+    assert 2 not in [doc_id for doc_id, _ in results]
+
+
+def test_rare_term_outweighs_common_term():
+    index = BM25Index(DOCUMENTS)
+    scores = index.scores("áo khoác")
+    assert int(np.argmax(scores)) == 1
+
+
+def test_top_k_mask_and_no_match():
+    index = BM25Index(DOCUMENTS)
+    assert len(index.search("áo", top_k=2)) == 2
+    mask = np.array([False, True, True, False])
+    assert [doc_id for doc_id, _ in index.search("áo thun", top_k=5, mask=mask)] == [1]
+    assert index.search("điện thoại", top_k=5) == []
+    assert BM25Index([]).search("áo") == []
+
+
+def test_reciprocal_rank_fusion():
+    keyword = ["a", "b", "c"]
+    vector = ["c", "a", "d"]
+    fused = reciprocal_rank_fusion([keyword, vector], top_k=3, k=60)
+    assert [item for item, _ in fused] == ["a", "c", "b"]
+    assert abs(fused[0][1] - (1 / 61 + 1 / 62)) < 1e-12
+    # Hoà điểm: giữ thứ tự của bảng xếp hạng đầu tiên
+    assert [item for item, _ in reciprocal_rank_fusion([["x"], ["y"]], top_k=2)] == ["x", "y"]
+    assert reciprocal_rank_fusion([[], []], top_k=5) == []
+
+
+if __name__ == "__main__":
+    test_bm25_ranking()
+    test_rare_term_outweighs_common_term()
+    test_top_k_mask_and_no_match()
+    test_reciprocal_rank_fusion()
+    print("✅ Search index tests passed!")
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test cache câu trả lời theo câu hỏi gần nghĩa (semantic_cache), với embedding cố định
+"""
+
+import numpy as np
+
+from semantic_cache import SemanticAnswerCache, evaluate_thresholds
+
+# Vector đã chuẩn hoá L2: cosine giữa hai câu = tích vô hướng
+VECTORS = {
+    "áo thun giá bao nhiêu": [1.0, 0.0, 0.0],
+    "giá áo thun là bao nhiêu": [0.95, np.sqrt(1 - 0.95 ** 2), 0.0],
+    "áo thun màu gì": [0.6, 0.8, 0.0],
+    "giày size nào": [0.0, 0.0, 1.0],
+    "có không": [0.0, 0.0, 0.0],
+}
+
+
+def embed(texts):
+    return [VECTORS[t] for t in texts]
+
+
+def test_threshold():
+    cache = SemanticAnswerCache(embed, threshold=0.9)
+    cache.set("áo thun giá bao nhiêu", "product", "150.000đ")
+    hit = cache.get("giá áo thun là bao nhiêu", "product")
+    assert hit.answer == "150.000đ" and abs(hit.similarity - 0.95) < 1e-6
+    assert hit.matched_question == "áo thun giá bao nhiêu"
+    assert cache.get("áo thun màu gì", "product") is None
+    assert cache.get("có không", "product") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate_by_threshold"]["0.9"] == 0.5
+
+
+def test_scope_isolation():
+    cache = SemanticAnswerCache(embed, threshold=0.9)
+    cache.set("áo thun giá bao nhiêu", "product|context-1", "150.000đ")
+    assert cache.get("giá áo thun là bao nhiêu", "product|context-2") is None
+    assert cache.get("giá áo thun là bao nhiêu", "product|context-1").answer == "150.000đ"
+
+
+def test_lru_eviction_and_ttl():
+    cache = SemanticAnswerCache(embed, threshold=0.9, max_entries=2)
+    cache.set("áo thun giá bao nhiêu", "a", "1")
+    cache.set("giày size nào", "b", "2")
+    cache.get("giày size nào", "b")
+    cache.set("áo thun màu gì", "c", "3")
+    assert cache.get("áo thun giá bao nhiêu", "a") is None
+    assert cache.get("giày size nào", "b").answer == "2"
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+    expired = SemanticAnswerCache(embed, ttl_seconds=-1)
+    expired.set("giày size nào", "b", "2")
+    assert expired.get("giày size nào", "b") is None and expired.stats()["expired"] == 1
+
+
+def test_evaluate_thresholds():
+    pairs = [("áo thun giá bao nhiêu", "giá áo thun là bao nhiêu", True), ("áo thun giá bao nhiêu", "áo thun màu gì", False)]
+    report = {r["threshold"]: r for r in evaluate_thresholds(embed, pairs, thresholds=(0.5, 0.9))}
+    assert report[0.5] == {"threshold": 0.5, "hit_rate": 1.0, "false_hit_rate": 1.0}
+    assert report[0.9] == {"threshold": 0.9, "hit_rate": 1.0, "false_hit_rate": 0.0}
+
+
+if __name__ == "__main__":
+    test_threshold()
+    test_scope_isolation()
+    test_lru_eviction_and_ttl()
+    test_evaluate_thresholds()
+    print("✅ Semantic cache tests passed!")
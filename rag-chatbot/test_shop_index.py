@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test tìm shop được nhắc tới trong tin nhắn (ShopNameIndex)
+"""
+
+from shop_index import ShopNameIndex
+
+SHOPS = [{"shopName": name} for name in ["An An", "Điện Máy", "Hoa Tươi", "TechZone", "Thời Trang ABC", "ABC Shop"]]
+INDEX = ShopNameIndex(SHOPS, min_score=0.6)
+
+
+def matched_name(message):
+    shop = INDEX.match(message)
+    return shop["shopName"] if shop else None
+
+
+def test_single_shared_syllable_does_not_match():
+    """Một âm tiết chung với tên nhiều âm tiết không được coi là nhắc tới shop"""
+    assert matched_name("shop này có an toàn không") is None
+    assert matched_name("shop nào bán điện thoại") is None
+    assert matched_name("cửa hàng có bán hoa không") is None
+
+
+def test_exact_and_misspelled_names_match():
+    assert matched_name("shop An An có gì") == "An An"
+    assert matched_name("điện máy có bán tủ lạnh ko") == "Điện Máy"
+    assert matched_name("shop hoa tuoi o dau") == "Hoa Tươi"
+    assert matched_name("shop techzon bán gì") == "TechZone"
+    assert matched_name("shop thoi trag abc") == "Thời Trang ABC"
+    assert matched_name("shop abcshop bán gì") == "ABC Shop"
+
+
+if __name__ == "__main__":
+    test_single_shared_syllable_does_not_match()
+    test_exact_and_misspelled_names_match()
+    print("✅ Shop index tests passed!")
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Text Utils
+Chuẩn hoá và tách từ tiếng Việt dùng chung cho các index tìm kiếm
+"""
+
+import re
+import unicodedata
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Âm tiết phổ biến trong câu hỏi nhưng không mang nghĩa tìm kiếm (đã bỏ dấu)
+STOPWORDS = {
+    "a", "ah", "ak", "ban", "bao", "cac", "cho", "co", "cua", "da", "dang", "de", "den", "duoc",
+    "duoi", "gi", "gia", "giup", "hay", "hang", "khong", "ko", "la", "lam", "mot", "minh", "mua",
+    "muon", "nao", "nay", "nhe", "nhieu", "nhung", "nhu", "oi", "pham", "san", "shop", "the",
+    "thi", "tim", "toi", "tren", "tu", "va", "ve", "voi", "xem",
+}
+
+
+def normalize_text(text: str) -> str:
+    """NFC, chữ thường, gộp khoảng trắng"""
+    return " ".join(unicodedata.normalize("NFC", text or "").lower().split())
+
+
+def _build_fold_table() -> dict:
+    table = {}
+    for code in list(range(0x00C0, 0x0250)) + list(range(0x1E00, 0x1F00)):
+        ch = chr(code)
+        base = "".join(c for c in unicodedata.normalize("NFD", ch) if unicodedata.category(c) != "Mn")
+        if base != ch:
+            table[code] = base
+    for code in range(0x0300, 0x0370):
+        table[code] = None
+    table[ord("đ")] = "d"
+    table[ord("Đ")] = "D"
+    return table
+
+
+# Bảng bỏ dấu cho chữ Latin dựng sẵn (NFC); dấu kết hợp rời bị xoá
+_FOLD_TABLE = _build_fold_table()
+
+
+def fold_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'Điện thoại' -> 'Dien thoai'"""
+    return unicodedata.normalize("NFC", text or "").translate(_FOLD_TABLE)
+
+
+def syllables(text: str) -> List[str]:
+    """Tách âm tiết đã chuẩn hoá và bỏ dấu"""
+    return _TOKEN_RE.findall(fold_accents(normalize_text(text)))
+
+
+def tokenize(text: str) -> List[str]:
+    """Term cho index: âm tiết (trừ stopword) và cặp âm tiết liền kề, vì từ tiếng Việt
+    thường gồm nhiều âm tiết ('dien thoai', 'ao khoac')."""
+    parts = syllables(text)
+    terms = [p for p in parts if p not in STOPWORDS]
+    for first, second in zip(parts, parts[1:]):
+        if first not in STOPWORDS or second not in STOPWORDS:
+            terms.append(f"{first} {second}")
+    return terms
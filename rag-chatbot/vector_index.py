@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Vector Index
+Index vector sản phẩm lưu trong chroma_db, embedding hoàn toàn cục bộ (không gọi mạng)
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from latency import LatencyRecorder
+from text_utils import STOPWORDS, syllables, tokenize
+
+try:
+    import chromadb
+    CHROMADB_AVAILABLE = True
+except ImportError:
+    CHROMADB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Vector hashing thưa nên HNSW cần ef lớn hơn mặc định (100) để không bỏ sót láng giềng gần nhất
+_HNSW_METADATA = {"hnsw:space": "cosine", "hnsw:construction_ef": 200, "hnsw:search_ef": 1000}
+
+
+@lru_cache(maxsize=200_000)
+def _feature_slot(feature: str, dim: int) -> tuple:
+    # blake2b thay cho hash() để vector giống nhau giữa các process / lần khởi động
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, 1.0 if (value >> 63) & 1 else -1.0
+
+
+class HashingEmbeddingFunction:
+    """Embedding bằng feature hashing trên term (âm tiết, cặp âm tiết) và trigram ký tự đã bỏ dấu.
+    Không cần model hay mạng; trigram giúp chịu được lỗi chính tả / gõ không dấu.
+    Chỉ đo độ giống về từ, không hiểu nghĩa: 'áo màu đen' và 'áo màu trắng' rất gần nhau."""
+
+    # Vector có phản ánh nghĩa không (dùng được cho cache ngữ nghĩa / tìm kiếm theo ý)
+    semantic = False
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f"hash{dim}"
+
+    def _features(self, text: str) -> List[tuple]:
+        features = [(term, 1.0) for term in tokenize(text)]
+        for word in syllables(text):
+            if word in STOPWORDS:
+                continue
+            padded = f"#{word}#"
+            features.extend((padded[i:i + 3], 0.5) for i in range(len(padded) - 2))
+        return features
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                slot, sign = _feature_slot(feature, self.dim)
+                vectors[row, slot] += sign * weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class SentenceTransformerEmbeddingFunction:
+    """Embedding bằng model sentence-transformers đã có sẵn trên đĩa (không tải từ mạng)"""
+
+    semantic = True
+
+    def __init__(self, model_path: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_path, device="cpu", local_files_only=True)
+        self.name = "st_" + os.path.basename(os.path.normpath(model_path)).replace("-", "_")
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+
+def create_embedding_function(model_path: Optional[str] = None):
+    """Dùng model cục bộ nếu được cấu hình và có trên đĩa, ngược lại dùng hashing embedding"""
+    if model_path and os.path.isdir(model_path):
+        try:
+            return SentenceTransformerEmbeddingFunction(model_path)
+        except Exception as e:
+            logger.error(f"Cannot load local embedding model {model_path}: {e}")
+    return HashingEmbeddingFunction()
+
+
+def product_document(product: Dict) -> str:
+    name = str(product.get('productName') or product.get('name') or '')
+    return f"{name}. {product.get('description') or ''}".strip()
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+
+class VectorProductIndex:
+    """Index sản phẩm trong một collection Chroma riêng (theo embedding) của thư mục chroma_db.
+
+    sync() chỉ embed sản phẩm mới / thay đổi nội dung và xoá sản phẩm không còn trong catalog;
+    search() chạy truy vấn ANN (HNSW, cosine) và ghi lại độ trễ."""
+
+    def __init__(self, path: str, embedding_function=None, collection_prefix: str = "streamcart_products"):
+        self.path = path
+        self.embedding_function = embedding_function or HashingEmbeddingFunction()
+        self.collection_name = f"{collection_prefix}_{self.embedding_function.name}"
+        self._collection = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.latency = LatencyRecorder()
+        self._stats: Dict[str, Any] = {
+            "available": CHROMADB_AVAILABLE,
+            "load_ms": None,
+            "documents": 0,
+            "last_sync_ms": None,
+            "last_sync_embedded": 0,
+            "last_sync_deleted": 0,
+            "queries": 0,
+        }
+
+    @property
+    def available(self) -> bool:
+        return CHROMADB_AVAILABLE
+
+    def _get_collection(self):
+        # sync() và search() có thể chạy song song ở các thread khác nhau; chromadb không an toàn
+        # khi khởi tạo cùng một PersistentClient đồng thời
+        with self._load_lock:
+            if self._collection is None:
+                self._load_collection()
+        return self._collection
+
+    def _load_collection(self):
+        started = time.perf_counter()
+        client = chromadb.PersistentClient(path=self.path)
+        self._collection = client.get_or_create_collection(self.collection_name, metadata=_HNSW_METADATA)
+        self._stats["load_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        self._stats["documents"] = self._collection.count()
+        logger.info(
+            f"Vector index loaded: {self.path} collection={self.collection_name} "
+            f"documents={self._stats['documents']} in {self._stats['load_ms']}ms"
+        )
+
+    def sync(self, products: List[Dict], batch_size: int = 1000) -> int:
+        """Đồng bộ collection với catalog hiện tại, trả về số sản phẩm đã embed lại"""
+        if not self.available:
+            return 0
+        with self._lock:
+            started = time.perf_counter()
+            collection = self._get_collection()
+            documents: Dict[str, str] = {}
+            for p in products:
+                if p.get('id') is not None:
+                    documents[str(p['id'])] = product_document(p)
+            existing = collection.get(include=["metadatas"])
+            existing_hashes = {
+                pid: (meta or {}).get("content_hash") for pid, meta in zip(existing["ids"], existing["metadatas"])
+            }
+            changed = [pid for pid, doc in documents.items() if existing_hashes.get(pid) != _content_hash(doc)]
+            removed = [pid for pid in existing_hashes if pid not in documents]
+            for start in range(0, len(changed), batch_size):
+                ids = changed[start:start + batch_size]
+                texts = [documents[pid] for pid in ids]
+                collection.upsert(
+                    ids=ids,
+                    embeddings=self.embedding_function(texts).tolist(),
+                    documents=texts,
+                    metadatas=[{"content_hash": _content_hash(t)} for t in texts],
+                )
+            for start in range(0, len(removed), batch_size):
+                collection.delete(ids=removed[start:start + batch_size])
+            self._stats.update({
+                "documents": collection.count(),
+                "last_sync_ms": round((time.perf_counter() - started) * 1000, 2),
+                "last_sync_embedded": len(changed),
+                "last_sync_deleted": len(removed),
+            })
+            logger.info(f"Vector index synced: embedded={len(changed)} deleted={len(removed)} in {self._stats['last_sync_ms']}ms")
+            return len(changed)
+
+    def search(self, query: str, top_k: int = 20) -> List[tuple]:
+        """Top-k (product_id, similarity) gần nhất với câu truy vấn"""
+        if not self.available:
+            return []
+        collection = self._get_collection()
+        if self._stats["documents"] == 0:
+            return []
+        with self.latency.measure("query"):
+            result = collection.query(
+                query_embeddings=self.embedding_function([query]).tolist(),
+                n_results=min(top_k, self._stats["documents"]),
+                include=["distances"],
+            )
+        self._stats["queries"] += 1
+        return [(pid, 1.0 - float(dist)) for pid, dist in zip(result["ids"][0], result["distances"][0])]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["latency"] = self.latency.summary()
+        return stats